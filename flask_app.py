@@ -3,74 +3,83 @@ Flask-based Fashion Police Pi Client
 More control over camera and UI than Streamlit
 """
 
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, session, send_file, abort, g, Response
 import base64
+import binascii
+import hashlib
 import io
-from PIL import Image
+import json
+import math
+from PIL import Image, UnidentifiedImageError
+import os
 import time
 import secrets
+import threading
 from pathlib import Path
 
-from src.scripts.classify_outfit import OutfitClassifier
+from src.scripts.batch_scheduler import BatchScheduler
+from src.scripts.preview_scheduler import PreviewScheduler
+from src.scripts.preprocess import prepare_image
+from src import config, metrics
+from src.admission import DEGRADED_MODE, AdmissionController
 from src.database import FashionDB
+from src.embedding_store import EmbeddingStore
+from src.frame_cache import FrameCache, frame_key
+from src.image_store import ImageStore, image_mimetype
+from src.model_loader import ModelLoader
+from src.persistence import PersistenceWriter
+from src.results_store import ResultsStore
+from src.scripts.snapshots import model_id
+
+
+
+def load_secret_key():
+    """
+    Session signing key shared by every worker process and kept across
+    restarts: FASHION_POLICE_SECRET_KEY, or a random key created once in
+    data/secret_key
+    """
+    if config.SECRET_KEY:
+        return config.SECRET_KEY
+    path = config.SECRET_KEY_FILE
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        # O_EXCL: when several workers start at once, exactly one creates it
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_hex(32))
+    except FileExistsError:
+        pass
+    for _ in range(50):
+        key = path.read_text().strip()
+        if key:
+            return key
+        time.sleep(0.01)  # another process is still writing it
+    raise RuntimeError(f"Empty session key file {path}")
 
-app = Flask(__name__)
-app.secret_key = secrets.token_hex(16)
 
-# Store results in memory (could use Redis/DB for production)
-results_store = {}
+app = Flask(__name__)
+app.secret_key = load_secret_key()
 
 # Initialize database and storage directories
-db = FashionDB("data/predictions.json")
-DATA_DIR = Path("data/images")
-DATA_DIR.mkdir(parents=True, exist_ok=True)
+db = FashionDB(config.DATA_DIR / "predictions.db")
+db.migrate_json(config.DATA_DIR / "predictions.json")  # one-shot import of the legacy JSON store
 
-# Load the outfit classifier at startup
-print("Initializing Fashion Police ML models...")
-classifier = OutfitClassifier()
-print("Fashion Police is ready!")
+# Anonymized overlays (content-addressed) and their thumbnails, within a disk budget
+image_store = ImageStore(db)
 
+# Every record's CLIP image embedding, for re-scoring and similar-outfit lookups
+embeddings = EmbeddingStore(model_id=model_id(config.CLIP_MODEL_NAME, config.CLIP_MODEL_REVISION))
 
-@app.route('/')
-def index():
-    """Main camera page"""
-    return render_template('camera.html')
+# Overlay images and DB writes happen off the request path; replay anything
+# a previous run queued but never wrote
+persistence = PersistenceWriter(db, image_store, embeddings=embeddings)
+persistence.recover()
 
 
-@app.route('/process_image', methods=['POST'])
-def process_image():
-    """Process captured image and return predictions"""
-    data = request.get_json()
-    image_data = data.get('image')
-    
-    if not image_data:
-        return jsonify({'error': 'No image provided'}), 400
-    
-    # Decode base64 image
-    image_data = image_data.split(',')[1]  # Remove data:image/jpeg;base64, prefix
-    image_bytes = base64.b64decode(image_data)
-    
-    # Convert to PIL Image
-    image = Image.open(io.BytesIO(image_bytes))
-    
-    # Run FashionCLIP inference
-    predictions, display_overlay, anonymized_overlay = classifier.classify(image)
-    
-    # Generate record ID
-    record_id = f"outfit_{int(time.time())}"
-    
-    # Save ANONYMIZED overlay to disk (background white, face black, clothing original)
-    overlay_filename = f"{record_id}_anonymized.jpg"
-    overlay_path = DATA_DIR / overlay_filename
-    anonymized_overlay.save(overlay_path, format='JPEG', quality=95)
-    
-    # Convert DISPLAY overlay to base64 for web (with colored clothing overlay)
-    overlay_buffer = io.BytesIO()
-    display_overlay.save(overlay_buffer, format='JPEG', quality=95)
-    overlay_base64 = base64.b64encode(overlay_buffer.getvalue()).decode('utf-8')
-    
-    # Build result structure
-    result = {
+def build_result(record_id, predictions):
+    """Build the result structure shown on the results page"""
+    return {
         "record_id": record_id,
         "predictions": [
             {
@@ -86,51 +95,305 @@ def process_image():
             "confidence": predictions[0]["score"]
         }
     }
+
+
+def load_result_from_db(record_id):
+    """Rebuild an evicted result from the database and the saved anonymized overlay (or its thumbnail)"""
+    record = db.get_prediction(record_id)
+    if record is None:
+        return None
+    try:
+        overlay = Path(record["overlay_path"]).read_bytes()
+    except (OSError, TypeError):
+        return None
+    return {
+        'result': build_result(record_id, record["all_predictions"]),
+        'image': None,
+        'overlay': overlay
+    }
+
+
+# Recent results, bounded by memory budget and TTL (evicted entries spill to disk)
+results_store = ResultsStore(loader=load_result_from_db)
+
+# The outfit classifier loads in the background once the server is up,
+# so importing the app (and serving the camera page) never waits for it
+models = ModelLoader()
+# Concurrent requests (e.g. several kiosks sharing one server) are batched
+scheduler = BatchScheduler(models)
+# Caps concurrent classifications and switches to a cheaper pipeline under load
+admission = AdmissionController()
+# Retakes of nearly the same photo reuse the previous results
+frame_cache = FrameCache()
+# Live style preview while framing the shot; yields to waiting shutter photos
+preview_scheduler = PreviewScheduler(models, busy=lambda: scheduler.queue_depth > 0)
+metrics.gauge("fashion_batch_queue_depth", "Requests waiting for the batch scheduler").set_function(
+    lambda: scheduler.queue_depth
+)
+
+
+def read_uploaded_image():
+    """
+    Return the uploaded photo as encoded bytes
+
+    Accepts a raw image/* body, a multipart 'image' file field, or the
+    legacy JSON body with a base64 data URL (ValueError if it is not valid
+    base64, or if the bytes are not an image).
+    """
+    if request.mimetype and request.mimetype.startswith('image/'):
+        image_bytes = request.get_data()
+    elif 'image' in request.files:
+        image_bytes = request.files['image'].read()
+    else:
+        data = request.get_json(silent=True) or {}
+        image_data = data.get('image')
+        if not image_data:
+            return None
+        if not isinstance(image_data, str):
+            raise ValueError("image must be a base64 data URL")
+        
+        # Decode base64 image
+        image_data = image_data.split(',')[-1]  # Remove data:image/jpeg;base64, prefix
+        try:
+            image_bytes = base64.b64decode(image_data, validate=True)
+        except (binascii.Error, ValueError) as e:
+            raise ValueError(f"Invalid base64 image: {e}") from None
     
-    # Save prediction to database
-    db.save_prediction(
-        record_id=record_id,
-        image_path=str(overlay_path),
-        overlay_path=str(overlay_path),
-        predictions=predictions
-    )
+    if image_bytes:
+        verify_image(image_bytes)
+    return image_bytes
+
+
+def verify_image(image_bytes):
+    """
+    Raise ValueError unless the bytes decode as an image
+
+    JPEGs are decoded at reduced size (draft mode), so this costs a small
+    fraction of the real decode while still catching truncated uploads.
+    """
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            image.draft("RGB", (64, 64))
+            image.load()
+    except (UnidentifiedImageError, OSError):
+        raise ValueError("Invalid image") from None
+
+
+def read_crop_options():
+    """
+    Optional person box and resolution cap for the uploaded photo
+
+    Read from the query string, form fields or JSON body:
+        box: "left,top,right,bottom" in the uploaded image's pixels
+        max_side: longest side of the working frame (capped by config.MAX_IMAGE_SIDE)
+    """
+    params = dict(request.args)
+    params.update(request.form)
+    if request.is_json:
+        params.update(request.get_json(silent=True) or {})
     
-    # Store result in memory for session
-    results_store[record_id] = {
-        'result': result,
-        'image': image_data,
-        'overlay': overlay_base64
-    }
+    box = params.get('box')
+    if isinstance(box, str):
+        box = box.split(',')
+    if box is not None:
+        box = tuple(float(v) for v in box)
+        if len(box) != 4:
+            raise ValueError("box must have 4 values")
+        if not all(math.isfinite(v) for v in box):
+            raise ValueError("box values must be finite")
+    
+    # Clients may ask for a smaller working frame, never a larger one
+    max_side = config.MAX_IMAGE_SIDE
+    if params.get('max_side') not in (None, ''):
+        requested = int(params['max_side'])
+        if requested <= 0:
+            raise ValueError("max_side must be positive")
+        max_side = min(requested, max_side) if max_side > 0 else requested
+    return box, max_side
+
+
+@app.before_request
+def _start_model_loading():
+    models.start()
+
+
+@app.before_request
+def _start_request_timer():
+    if metrics.ENABLED:
+        g.request_start = time.perf_counter()
+        metrics.IN_FLIGHT.inc(endpoint=request.endpoint)
+
+
+@app.teardown_request
+def _record_request(error=None):
+    start = g.pop('request_start', None)
+    if start is None:
+        return
+    metrics.IN_FLIGHT.dec(endpoint=request.endpoint)
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=request.endpoint)
+
+
+@app.after_request
+def _count_request(response):
+    metrics.REQUESTS.inc(endpoint=request.endpoint, status=response.status_code)
+    return response
+
+
+@app.route('/')
+def index():
+    """Main camera page"""
+    return render_template('camera.html')
+
+
+@app.route('/ready')
+def ready():
+    """Readiness probe: 200 once the models are loaded and warmed up"""
+    status = models.status()
+    return jsonify(status), (200 if status['ready'] else 503)
+
+
+def classify_upload(image_bytes, box, max_side, degraded=False):
+    """Classify an uploaded photo, queue it for storage and cache its result"""
+    if degraded:
+        max_side = min(max_side or config.DEGRADED_MAX_SIDE, config.DEGRADED_MAX_SIDE)
+    
+    # Decode once, cap the resolution and crop to the person for both models
+    with metrics.stage("decode"):
+        image = prepare_image(Image.open(io.BytesIO(image_bytes)), box=box, max_side=max_side)
+    
+    # Run FashionCLIP inference (batched with any concurrent requests),
+    # unless this is a retake of a frame classified moments ago
+    key = frame_key(image) if frame_cache.enabled else None
+    variant = (degraded, image.frame.size)
+    classified = frame_cache.get(key, variant) if key is not None else None
+    if classified is None:
+        classified = scheduler.classify(image, degraded=degraded)
+        if key is not None:
+            frame_cache.put(key, classified, variant)
+    predictions, display_overlay, anonymized_overlay, embedding = classified
+    
+    # Generate record ID (random suffix keeps IDs unique across concurrent requests)
+    record_id = f"outfit_{int(time.time())}_{secrets.token_hex(4)}"
+    
+    # Queue the ANONYMIZED overlay (background white, face black, clothing original)
+    # the prediction record and the image embedding for the background writer
+    persistence.submit_prediction(record_id, anonymized_overlay, predictions, embedding)
+    
+    # Encode DISPLAY overlay for web (with colored clothing overlay)
+    with metrics.stage("jpeg_encode"):
+        overlay_buffer = io.BytesIO()
+        display_overlay.save(overlay_buffer, format='JPEG', quality=95)
+    
+    # Build result structure
+    result = build_result(record_id, predictions)
+    
+    # Store result for the results and feedback pages
+    results_store.put(record_id, result, image=image_bytes, overlay=overlay_buffer.getvalue())
+    return result
+
+
+@app.route('/process_image', methods=['POST'])
+def process_image():
+    """Process captured image and return predictions"""
+    if not models.ready:
+        response = jsonify({'error': 'Models are still warming up', **models.status()})
+        response.headers['Retry-After'] = '2'
+        return response, 503
+    
+    try:
+        image_bytes = read_uploaded_image()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if not image_bytes:
+        return jsonify({'error': 'No image provided'}), 400
+    
+    try:
+        box, max_side = read_crop_options()
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid crop options: {e}'}), 400
+    
+    # Bounded concurrency: turn visitors away quickly rather than slow everyone down
+    mode = admission.acquire()
+    if mode is None:
+        response = jsonify({'error': 'Too many photos in progress', **admission.status()})
+        response.headers['Retry-After'] = str(config.ADMISSION_RETRY_AFTER)
+        return response, 503
+    try:
+        result = classify_upload(image_bytes, box, max_side, degraded=mode == DEGRADED_MODE)
+    finally:
+        admission.release()
     
     # Store in session
-    session['current_record_id'] = record_id
+    session['current_record_id'] = result['record_id']
+    
+    response = jsonify(result)
+    response.headers['X-Pipeline-Mode'] = mode
+    return response
+
+
+@app.route('/preview', methods=['POST'])
+def preview():
+    """
+    Live style guess for a small preview frame (style predictor only)
+
+    Frames that a newer frame overtook, or that arrive while shutter photos
+    are being classified, come back with "dropped": true and no predictions.
+    """
+    if not models.ready:
+        response = jsonify({'error': 'Models are still warming up', **models.status()})
+        response.headers['Retry-After'] = '2'
+        return response, 503
+    
+    try:
+        image_bytes = read_uploaded_image()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not image_bytes:
+        return jsonify({'error': 'No image provided'}), 400
+    
+    try:
+        box, _ = read_crop_options()
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid crop options: {e}'}), 400
+    
+    # Decode here, so an undecodable frame is a 400 rather than a failure in the preview worker
+    try:
+        frame = preview_scheduler.decode(image_bytes)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify(result)
+    predictions = preview_scheduler.submit(frame, box).result()
+    if predictions is None:
+        return jsonify({'dropped': True})
+    return jsonify({
+        'dropped': False,
+        'predictions': [
+            {"name": pred["name"], "confidence": pred["score"]}
+            for pred in predictions[:3]
+        ]
+    })
 
 
 @app.route('/results')
 def results():
     """Results page"""
     record_id = session.get('current_record_id')
-    if not record_id or record_id not in results_store:
+    data = results_store.get(record_id)
+    if data is None:
         return "No results available. Please take a photo first.", 404
     
-    data = results_store[record_id]
-    return render_template('results.html', 
-                         result=data['result'], 
-                         image_data=data['image'],
-                         overlay_data=data['overlay'])
+    return render_template('results.html', result=data['result'])
 
 
 @app.route('/feedback')
 def feedback():
     """Feedback page"""
     record_id = session.get('current_record_id')
-    if not record_id or record_id not in results_store:
+    data = results_store.get(record_id)
+    if data is None:
         return "No results available. Please take a photo first.", 404
     
-    data = results_store[record_id]
-    
     styles = [
         "Urban Streetwear", "Formal Business", "Casual Chic",
         "Sporty / Athleisure", "Vintage / Retro", "Bohemian",
@@ -140,7 +403,56 @@ def feedback():
     
     return render_template('feedback.html', 
                          styles=styles,
-                         image_data=data['image'])
+                         record_id=record_id)
+
+
+@app.route('/image/<record_id>/<variant>')
+def image(record_id, variant):
+    """
+    Serve a result image
+
+    Variants:
+        photo: the original photo (only to the visitor who took it), falling
+               back to the overlay once the original has been discarded
+        overlay: the display overlay with colored clothing regions
+        thumb: a small WebP of the saved anonymized overlay
+    """
+    if variant == 'thumb':
+        return thumbnail(record_id)
+    if variant not in ('photo', 'overlay'):
+        abort(404)
+    data = results_store.get(record_id)
+    if data is None:
+        abort(404)
+    
+    image_bytes = data['overlay']
+    if variant == 'photo' and data['image'] and session.get('current_record_id') == record_id:
+        image_bytes = data['image']
+    
+    response = send_file(
+        io.BytesIO(image_bytes),
+        mimetype=image_mimetype(image_bytes),
+        etag=hashlib.sha1(image_bytes).hexdigest(),
+        max_age=int(results_store.ttl_seconds),
+        conditional=True
+    )
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
+
+
+def thumbnail(record_id):
+    """Serve the thumbnail of a saved record, made from its overlay on first request"""
+    record = db.get_prediction(record_id)
+    path = record and (record["image_path"] or record["overlay_path"])
+    thumb = image_store.thumbnail(path) if path else None
+    if thumb is None:
+        abort(404)
+    # Named after the image's content hash, so the file never changes
+    response = send_file(thumb.absolute(), mimetype='image/webp', etag=thumb.stem, max_age=86400, conditional=True)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
 
 
 @app.route('/submit_feedback', methods=['POST'])
@@ -153,21 +465,132 @@ def submit_feedback():
     if not record_id:
         return jsonify({'error': 'No active session'}), 400
     
-    # Save user correction to database
-    success = db.save_feedback(record_id, style)
+    # The record may still be queued, so check the results store rather than the DB
+    success = results_store.get(record_id) is not None
     
     if success:
-        print(f"Feedback saved: {record_id} -> {style}")
+        # Written once the record's insert lands, even if another worker's writer still has it queued
+        persistence.submit_feedback(record_id, style)
+        print(f"Feedback queued: {record_id} -> {style}")
     
     return jsonify({'success': success, 'style': style})
 
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics for this process"""
+    if not metrics.ENABLED:
+        return "Metrics are disabled (FASHION_POLICE_METRICS=0)\n", 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+def find_similar(record_id, k=5):
+    """The k stored outfits closest to record_id's in CLIP space, with their top style"""
+    similar = []
+    for other_id, similarity in embeddings.nearest(record_id, k):
+        record = db.get_prediction(other_id)
+        if record is None:
+            continue
+        similar.append({
+            "record_id": other_id,
+            "similarity": similarity,
+            "top_prediction": record["top_prediction"],
+            "user_correction": record["user_correction"],
+        })
+    return similar
+
+
+@app.route('/similar/<record_id>')
+def similar(record_id):
+    """Outfits that look most like record_id's (nearest stored embeddings)"""
+    k = min(max(request.args.get('k', 5, type=int), 1), 50)
+    if record_id not in embeddings:
+        return jsonify({'error': 'No embedding stored for this record'}), 404
+    return jsonify({'record_id': record_id, 'similar': find_similar(record_id, k)})
+
+
+def encode_cursor(cursor):
+    """Opaque page token for a (timestamp, record_id) cursor"""
+    if cursor is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+
+def decode_cursor(token):
+    """(timestamp, record_id) from a page token; ValueError if it is not one"""
+    try:
+        timestamp, record_id = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {e}") from None
+    if not isinstance(timestamp, str) or not isinstance(record_id, str):
+        raise ValueError("Invalid cursor")
+    return timestamp, record_id
+
+
+@app.route('/history')
+def history():
+    """Prediction history, most recent first, one page per request (?limit=&cursor=)"""
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    cursor = None
+    if request.args.get('cursor'):
+        try:
+            cursor = decode_cursor(request.args['cursor'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    records, next_cursor = db.get_predictions_page(limit, cursor)
+    return jsonify({
+        'predictions': [
+            {
+                'record_id': record['record_id'],
+                'timestamp': record['timestamp'],
+                'top_prediction': record['top_prediction'],
+                'top_confidence': record['top_confidence'],
+                'predictions': record['all_predictions'],
+                'user_correction': record['user_correction'],
+                'feedback_timestamp': record['feedback_timestamp'],
+                'thumbnail': f"/image/{record['record_id']}/thumb" if record['overlay_path'] else None,
+            }
+            for record in records
+        ],
+        'next_cursor': encode_cursor(next_cursor),
+    })
+
+
+# Outfits similar to the latest record, for /stats. The nearest-neighbour scan
+# grows with the history, so it runs once per new record, not per page load
+_latest_similar = {}
+_latest_similar_lock = threading.Lock()
+
+
+def similar_to_latest():
+    """Similar outfits for the most recent record (None until it has an embedding)"""
+    latest = db.get_all_predictions(limit=1)
+    if not latest:
+        return None
+    record = latest[0]
+    with _latest_similar_lock:
+        if _latest_similar.get("record_id") != record["record_id"]:
+            if record["record_id"] not in embeddings:
+                return None
+            _latest_similar.clear()
+            _latest_similar.update({
+                "record_id": record["record_id"],
+                "top_prediction": record["top_prediction"],
+                "matches": find_similar(record["record_id"]),
+            })
+        return dict(_latest_similar)
+
+
 @app.route('/stats')
 def statistics():
     """Display statistics dashboard"""
-    stats = db.get_statistics()
-    return render_template('stats.html', stats=stats)
+    stats = db.get_statistics(rollup="day", rollup_limit=14)
+    return render_template('stats.html', stats=stats, similar=similar_to_latest())
 
 
 if __name__ == '__main__':
+    # The debug reloader re-runs this file in a child process that does the
+    # serving; only load the models there
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        models.start()
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,78 @@
+"""
+Production server configuration for Fashion Police
+
+    gunicorn -c gunicorn.conf.py
+
+Pre-fork serving: the master imports the app and loads both models once,
+then forks the workers, which share the model weights copy-on-write instead
+of each holding their own ~2GB copy. Every worker gets cores // workers
+torch threads so the processes do not oversubscribe the CPU.
+
+The master must not run any multi-threaded torch op before forking: an
+OpenMP thread pool started in the master leaves the workers' first parallel
+op deadlocked. Loading therefore runs single-threaded and the warm-up
+inference happens in each worker after the fork.
+"""
+
+import os
+
+# Workers share results through the spill directory (set before the app is imported)
+os.environ.setdefault("FASHION_POLICE_RESULTS_WRITE_THROUGH", "1")
+
+# (aliased: gunicorn reads every module-level name here as a setting, and
+# `config` is one of them)
+from src import config as fashion_config  # noqa: E402
+
+_cpu_count = os.cpu_count() or 1
+
+wsgi_app = "flask_app:app"
+bind = fashion_config.BIND
+workers = fashion_config.WORKERS or max(1, _cpu_count // 2)
+# Request threads per worker; concurrent requests are micro-batched together.
+# Enough for every admitted and queued photo plus a couple for the other
+# routes, so overload is answered by admission control with a fast 503
+# instead of piling up unseen in gunicorn's accept queue
+worker_class = "gthread"
+threads = max(2, fashion_config.ADMISSION_MAX_IN_FLIGHT + fashion_config.ADMISSION_MAX_QUEUE + 2)
+preload_app = True
+# Loading and converting the models in the master can take a while on a Pi
+timeout = 120
+
+
+def _threads_per_worker():
+    return fashion_config.WORKER_THREADS or max(1, _cpu_count // workers)
+
+
+def when_ready(server):
+    """Load the models in the master, after the app is imported and before forking"""
+    import torch
+    import flask_app
+
+    torch.set_num_threads(1)
+    flask_app.models.warm_up = False
+    try:
+        flask_app.models.load()
+        server.log.info("Models loaded in the master; forking %d workers", workers)
+    except RuntimeError as e:
+        # Workers still start and answer 503 on /ready so the failure is visible
+        server.log.error("%s", e)
+
+
+def post_fork(server, worker):
+    """Per-worker torch thread budget, then warm up in the background"""
+    import flask_app
+
+    if not flask_app.models.ready:
+        return
+    num_threads = _threads_per_worker()
+    flask_app.models.get().set_thread_budget(num_threads)
+    if fashion_config.WARMUP:
+        flask_app.models.rewarm()
+    server.log.info("Worker %s: %d torch threads", worker.pid, num_threads)
+
+
+def worker_exit(server, worker):
+    """Flush queued DB and overlay writes before the worker goes away"""
+    import flask_app
+
+    flask_app.persistence.close()
@@ -0,0 +1,141 @@
+"""
+Admission control for Fashion Police
+Keeps /process_image latency bounded when more visitors arrive than the CPU can serve
+
+At most `max_in_flight` photos are classified at once and at most
+`max_queue` more wait for a slot; anything beyond that gets a fast 503
+with Retry-After instead of slowing everyone down.
+
+When the time spent waiting for a slot stays above a target, the
+controller switches to a degraded pipeline (smaller input, no display
+overlay blend, optionally a smaller SegFormer) and switches back once the
+wait has dropped to half the target. A minimum time in each mode keeps it
+from flapping.
+"""
+
+import threading
+import time
+from typing import Optional
+
+from . import config, metrics
+
+
+IN_FLIGHT = metrics.gauge("fashion_admission_in_flight", "Photos being classified")
+WAITING = metrics.gauge("fashion_admission_waiting", "Photos waiting for a classification slot")
+QUEUE_WAIT = metrics.gauge("fashion_admission_queue_wait_seconds", "Smoothed wait for a classification slot")
+REJECTED = metrics.counter("fashion_admission_rejected_total", "Photos turned away with a 503", ("reason",))
+MODE_REQUESTS = metrics.counter("fashion_pipeline_requests_total", "Photos admitted, by pipeline mode", ("mode",))
+DEGRADED = metrics.gauge("fashion_pipeline_degraded", "1 while the degraded pipeline is in use")
+
+FULL = "full"
+DEGRADED_MODE = "degraded"
+
+# The smoothed wait halves every this many seconds without new requests
+_DECAY_HALF_LIFE = 10.0
+# Weight of each new observation in the smoothed wait
+_SMOOTHING = 0.2
+
+
+class AdmissionController:
+    """Bounded concurrency for classification, with an adaptive degraded mode"""
+
+    def __init__(
+        self,
+        max_in_flight: int = config.ADMISSION_MAX_IN_FLIGHT,
+        max_queue: int = config.ADMISSION_MAX_QUEUE,
+        queue_timeout: float = config.ADMISSION_QUEUE_TIMEOUT,
+        degrade_after: float = config.DEGRADE_QUEUE_SECONDS,
+        min_mode_seconds: float = config.DEGRADE_MIN_SECONDS,
+    ):
+        """
+        Args:
+            max_in_flight: Photos classified at the same time
+            max_queue: Photos allowed to wait for a slot; more are rejected at once
+            queue_timeout: Longest wait for a slot before giving up with a 503
+            degrade_after: Smoothed slot wait (seconds) that switches to the
+                degraded pipeline; 0 never degrades
+            min_mode_seconds: Least time spent in a mode before switching again
+        """
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.degrade_after = degrade_after
+        self.min_mode_seconds = min_mode_seconds
+        self.mode = FULL
+        self.in_flight = 0
+        self.waiting = 0
+        self._queue_wait = 0.0
+        self._last_observed = time.monotonic()
+        self._mode_since = time.monotonic()
+        self._condition = threading.Condition()
+        IN_FLIGHT.set_function(lambda: self.in_flight)
+        WAITING.set_function(lambda: self.waiting)
+        QUEUE_WAIT.set_function(lambda: self._queue_wait)
+        DEGRADED.set_function(lambda: float(self.mode == DEGRADED_MODE))
+
+    def acquire(self) -> Optional[str]:
+        """
+        Wait for a classification slot
+
+        Returns:
+            The pipeline mode to serve the photo with, or None if the server
+            is overloaded (the caller answers 503 and must not call release())
+        """
+        start = time.monotonic()
+        with self._condition:
+            if self.in_flight >= self.max_in_flight:
+                if self.waiting >= self.max_queue:
+                    REJECTED.inc(reason="queue_full")
+                    # A turned-away photo would have waited at least this long
+                    self._observe(self.queue_timeout)
+                    return None
+                self.waiting += 1
+                try:
+                    admitted = self._condition.wait_for(
+                        lambda: self.in_flight < self.max_in_flight, timeout=self.queue_timeout
+                    )
+                finally:
+                    self.waiting -= 1
+                if not admitted:
+                    REJECTED.inc(reason="timeout")
+                    self._observe(time.monotonic() - start)
+                    return None
+            self.in_flight += 1
+            self._observe(time.monotonic() - start)
+            mode = self.mode
+        MODE_REQUESTS.inc(mode=mode)
+        return mode
+
+    def release(self):
+        """Give back a slot taken by acquire()"""
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def status(self):
+        return {
+            'mode': self.mode,
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'queue_wait_seconds': round(self._queue_wait, 3),
+        }
+
+    def _observe(self, wait: float):
+        """Fold one slot wait into the smoothed wait and switch modes if needed (lock held)"""
+        now = time.monotonic()
+        # Decay over idle time, so a quiet period counts as load having dropped
+        self._queue_wait *= 0.5 ** ((now - self._last_observed) / _DECAY_HALF_LIFE)
+        self._queue_wait += _SMOOTHING * (wait - self._queue_wait)
+        self._last_observed = now
+
+        if self.degrade_after <= 0 or now - self._mode_since < self.min_mode_seconds:
+            return
+        if self.mode == FULL and self._queue_wait > self.degrade_after:
+            self._switch(DEGRADED_MODE, now)
+        elif self.mode == DEGRADED_MODE and self._queue_wait < self.degrade_after / 2:
+            self._switch(FULL, now)
+
+    def _switch(self, mode: str, now: float):
+        print(f"Pipeline mode: {self.mode} -> {mode} (slot wait {self._queue_wait:.2f}s)")
+        self.mode = mode
+        self._mode_since = now
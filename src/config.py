@@ -0,0 +1,128 @@
+"""
+Runtime configuration for Fashion Police
+Every setting can be overridden with a FASHION_POLICE_* environment variable
+"""
+
+import os
+from pathlib import Path
+
+
+def _env(name: str, default: str) -> str:
+    return os.environ.get(f"FASHION_POLICE_{name}", default)
+
+
+# Root directory for everything the app writes (gitignored)
+DATA_DIR = Path(_env("DATA_DIR", "data"))
+
+# Model identifiers
+SEG_MODEL_NAME = _env("SEG_MODEL", "mattmdjaga/segformer_b2_clothes")
+CLIP_MODEL_NAME = _env("CLIP_MODEL", "patrickjohncyh/fashion-clip")
+
+# Pinned Hub revisions (commit hash, tag or branch; empty = the cached "main")
+SEG_MODEL_REVISION = _env("SEG_MODEL_REVISION", "")
+CLIP_MODEL_REVISION = _env("CLIP_MODEL_REVISION", "")
+
+# Never contact the Hub: fail instead of downloading a missing snapshot
+HUB_OFFLINE = _env("HUB_OFFLINE", "0") == "1"
+
+# Precomputed style text embeddings (rebuilt when the style prompts change)
+EMBEDDING_CACHE_DIR = Path(_env("EMBEDDING_CACHE_DIR", str(DATA_DIR / "cache" / "style_embeddings")))
+
+# Run segmentation and style prediction side by side in OutfitClassifier
+CONCURRENT_INFERENCE = _env("CONCURRENT_INFERENCE", "1") == "1"
+
+# Intra-op torch threads for the "segmentation,clip" branches, e.g. "3,1"
+# (empty = split the available cores automatically)
+THREAD_SPLIT = _env("THREAD_SPLIT", "")
+
+# Micro-batching of concurrent /process_image requests
+BATCH_MAX_SIZE = int(_env("BATCH_MAX_SIZE", "4"))
+BATCH_MAX_WAIT_MS = float(_env("BATCH_MAX_WAIT_MS", "10"))
+
+# Per-visitor results kept between /process_image and /results + /feedback
+RESULTS_MAX_BYTES = int(_env("RESULTS_MAX_BYTES", str(64 * 1024 * 1024)))
+RESULTS_TTL_SECONDS = float(_env("RESULTS_TTL_SECONDS", "3600"))
+RESULTS_SPILL_DIR = Path(_env("RESULTS_SPILL_DIR", str(DATA_DIR / "cache" / "results")))
+# Write every result to the spill directory too (needed with several worker processes)
+RESULTS_WRITE_THROUGH = _env("RESULTS_WRITE_THROUGH", "0") == "1"
+
+# Segmentation label upsampling: "labels" (fast) or "logits" (bilinear, slower)
+SEG_UPSAMPLE = _env("SEG_UPSAMPLE", "labels")
+
+# Longest side of the working frame after decode (0 = keep the upload's resolution)
+MAX_IMAGE_SIDE = int(_env("MAX_IMAGE_SIDE", "1280"))
+
+# CPU inference backend per model: "eager" (fp32), "int8" or "torchscript"
+SEG_BACKEND = _env("SEG_BACKEND", "eager")
+CLIP_BACKEND = _env("CLIP_BACKEND", "eager")
+BACKEND_CACHE_DIR = Path(_env("BACKEND_CACHE_DIR", str(DATA_DIR / "cache" / "backends")))
+
+# Hot-path instrumentation exposed at /metrics (0 = off, near-zero overhead)
+METRICS_ENABLED = _env("METRICS", "1") == "1"
+
+# Background writer for overlays and DB records (0 = write on the request thread)
+BACKGROUND_PERSIST = _env("BACKGROUND_PERSIST", "1") == "1"
+PERSIST_QUEUE_SIZE = int(_env("PERSIST_QUEUE_SIZE", "64"))
+PERSIST_PUT_TIMEOUT = float(_env("PERSIST_PUT_TIMEOUT", "5"))
+# How long feedback waits for a record another worker has not inserted yet
+PERSIST_FEEDBACK_WAIT = float(_env("PERSIST_FEEDBACK_WAIT", "30"))
+JOURNAL_DIR = Path(_env("JOURNAL_DIR", str(DATA_DIR / "journal")))
+
+# Run one throwaway image through both models once they are loaded
+WARMUP = _env("WARMUP", "1") == "1"
+
+# Flask session signing key shared by all workers (empty = generated once
+# and kept in SECRET_KEY_FILE)
+SECRET_KEY = _env("SECRET_KEY", "")
+SECRET_KEY_FILE = Path(_env("SECRET_KEY_FILE", str(DATA_DIR / "secret_key")))
+
+# Pre-fork server (gunicorn.conf.py): worker processes (0 = half the cores)
+# and torch threads per worker (0 = cores // workers)
+WORKERS = int(_env("WORKERS", "0"))
+WORKER_THREADS = int(_env("WORKER_THREADS", "0"))
+BIND = _env("BIND", "0.0.0.0:5000")
+
+# Normalized CLIP image embedding of every record, for re-scoring the history
+# without re-running CLIP and for "similar outfits" lookups
+EMBEDDING_STORE_DIR = Path(_env("EMBEDDING_STORE_DIR", str(DATA_DIR / "embeddings")))
+
+# Near-duplicate frame cache: a retake within FRAME_CACHE_MAX_DISTANCE
+# differing perceptual-hash bits (of 128; -1 = off) of a recent frame
+# reuses its results instead of running the models
+FRAME_CACHE_MAX_DISTANCE = int(_env("FRAME_CACHE_MAX_DISTANCE", "6"))
+FRAME_CACHE_TTL_SECONDS = float(_env("FRAME_CACHE_TTL_SECONDS", "60"))
+FRAME_CACHE_MAX_BYTES = int(_env("FRAME_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Live style preview (/preview): CLIP only, on frames capped to PREVIEW_MAX_SIDE,
+# at most PREVIEW_MAX_FPS frames per second on PREVIEW_THREADS torch threads
+PREVIEW_MAX_SIDE = int(_env("PREVIEW_MAX_SIDE", "320"))
+PREVIEW_MAX_FPS = float(_env("PREVIEW_MAX_FPS", "2"))
+PREVIEW_THREADS = int(_env("PREVIEW_THREADS", "1"))
+
+# Admission control for /process_image: photos classified at once, photos
+# allowed to wait for a slot (more get a 503), and the longest wait
+ADMISSION_MAX_IN_FLIGHT = int(_env("ADMISSION_MAX_IN_FLIGHT", str(BATCH_MAX_SIZE)))
+ADMISSION_MAX_QUEUE = int(_env("ADMISSION_MAX_QUEUE", "8"))
+ADMISSION_QUEUE_TIMEOUT = float(_env("ADMISSION_QUEUE_TIMEOUT", "15"))
+ADMISSION_RETRY_AFTER = int(_env("ADMISSION_RETRY_AFTER", "5"))
+
+# Degraded pipeline while the smoothed wait for a slot exceeds
+# DEGRADE_QUEUE_SECONDS (0 = never); back to full at half of it
+DEGRADE_QUEUE_SECONDS = float(_env("DEGRADE_QUEUE_SECONDS", "3"))
+DEGRADE_MIN_SECONDS = float(_env("DEGRADE_MIN_SECONDS", "10"))
+DEGRADED_MAX_SIDE = int(_env("DEGRADED_MAX_SIDE", "640"))
+# Skip blending the colored display overlay (the results page shows the anonymized one)
+DEGRADED_SKIP_DISPLAY = _env("DEGRADED_SKIP_DISPLAY", "1") == "1"
+# Smaller SegFormer checkpoint for the degraded pipeline (empty = keep SEG_MODEL)
+DEGRADED_SEG_MODEL = _env("DEGRADED_SEG_MODEL", "")
+
+# Anonymized overlays: content-addressed full-size images (jpeg or webp) and
+# lazily made WebP thumbnails, within IMAGE_STORE_MAX_BYTES (0 = unlimited).
+# Over budget, the oldest records lose their full-size image first and keep a
+# thumbnail (IMAGE_EVICT=full), or lose both at once (IMAGE_EVICT=all)
+IMAGE_STORE_DIR = Path(_env("IMAGE_STORE_DIR", str(DATA_DIR / "images")))
+IMAGE_FORMAT = _env("IMAGE_FORMAT", "jpeg")
+IMAGE_QUALITY = int(_env("IMAGE_QUALITY", "90"))
+THUMBNAIL_SIZE = int(_env("THUMBNAIL_SIZE", "256"))
+IMAGE_STORE_MAX_BYTES = int(_env("IMAGE_STORE_MAX_BYTES", str(2 * 1024 ** 3)))
+IMAGE_EVICT = _env("IMAGE_EVICT", "full")
@@ -4,149 +4,546 @@ Stores predictions and user feedback for model improvement
 """
 
 import json
+import os
+import sqlite3
+import threading
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Iterator, List, Dict, Optional, Tuple
+
+from . import metrics
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    record_id TEXT PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    image_path TEXT,
+    overlay_path TEXT,
+    top_prediction TEXT NOT NULL,
+    top_confidence REAL NOT NULL,
+    all_predictions TEXT NOT NULL,
+    user_correction TEXT,
+    feedback_timestamp TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_predictions_timestamp ON predictions (timestamp, record_id);
+
+-- Image retention (ImageStore): find every record referencing a file, and walk
+-- the records that still have an image oldest first. Partial, so records whose
+-- images were evicted drop out of them
+CREATE INDEX IF NOT EXISTS idx_predictions_image_path ON predictions (image_path) WHERE image_path IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_predictions_overlay_path ON predictions (overlay_path) WHERE overlay_path IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_predictions_image_age ON predictions (timestamp, record_id) WHERE image_path IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_predictions_overlay_age ON predictions (timestamp, record_id) WHERE overlay_path IS NOT NULL;
+
+-- Running aggregates for the /stats dashboard, maintained by triggers below
+CREATE TABLE IF NOT EXISTS stat_totals (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stat_style_counts (
+    kind TEXT NOT NULL,
+    style TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (kind, style)
+);
+CREATE TABLE IF NOT EXISTS stat_confusion (
+    predicted TEXT NOT NULL,
+    corrected TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (predicted, corrected)
+);
+CREATE TABLE IF NOT EXISTS stat_rollups (
+    granularity TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    predictions INTEGER NOT NULL,
+    feedback INTEGER NOT NULL,
+    PRIMARY KEY (granularity, bucket)
+);
+"""
+
+# Length of the ISO timestamp prefix that identifies each rollup bucket
+ROLLUP_BUCKETS = {"hour": 13, "day": 10}
+
+
+def _stat_contribution(row: str, sign: str) -> str:
+    """SQL that adds (sign '+') or removes (sign '-') one record's share of the aggregates"""
+    statements = [
+        f"""INSERT INTO stat_totals (name, value) VALUES ('predictions', {sign}1)
+            ON CONFLICT (name) DO UPDATE SET value = value {sign} 1;""",
+        f"""INSERT INTO stat_totals (name, value) SELECT 'feedback', {sign}1 WHERE {row}.user_correction IS NOT NULL
+            ON CONFLICT (name) DO UPDATE SET value = value {sign} 1;""",
+        f"""INSERT INTO stat_style_counts (kind, style, count) VALUES ('prediction', {row}.top_prediction, {sign}1)
+            ON CONFLICT (kind, style) DO UPDATE SET count = count {sign} 1;""",
+        f"""INSERT INTO stat_style_counts (kind, style, count)
+            SELECT 'correction', {row}.user_correction, {sign}1 WHERE {row}.user_correction IS NOT NULL
+            ON CONFLICT (kind, style) DO UPDATE SET count = count {sign} 1;""",
+        f"""INSERT INTO stat_confusion (predicted, corrected, count)
+            SELECT {row}.top_prediction, {row}.user_correction, {sign}1 WHERE {row}.user_correction IS NOT NULL
+            ON CONFLICT (predicted, corrected) DO UPDATE SET count = count {sign} 1;""",
+    ]
+    for granularity, length in ROLLUP_BUCKETS.items():
+        statements += [
+            f"""INSERT INTO stat_rollups (granularity, bucket, predictions, feedback)
+                VALUES ('{granularity}', substr({row}.timestamp, 1, {length}), {sign}1, 0)
+                ON CONFLICT (granularity, bucket) DO UPDATE SET predictions = predictions {sign} 1;""",
+            f"""INSERT INTO stat_rollups (granularity, bucket, predictions, feedback)
+                SELECT '{granularity}', substr(COALESCE({row}.feedback_timestamp, {row}.timestamp), 1, {length}), 0, {sign}1
+                WHERE {row}.user_correction IS NOT NULL
+                ON CONFLICT (granularity, bucket) DO UPDATE SET feedback = feedback {sign} 1;""",
+        ]
+    return "\n".join(statements)
+
+
+STAT_TRIGGERS = {
+    "stats_after_insert": f"""
+CREATE TRIGGER IF NOT EXISTS stats_after_insert AFTER INSERT ON predictions
+BEGIN
+{_stat_contribution("NEW", "+")}
+END""",
+    "stats_after_update": f"""
+CREATE TRIGGER IF NOT EXISTS stats_after_update
+AFTER UPDATE OF top_prediction, user_correction, feedback_timestamp ON predictions
+WHEN OLD.top_prediction IS NOT NEW.top_prediction
+  OR OLD.user_correction IS NOT NEW.user_correction
+  OR OLD.feedback_timestamp IS NOT NEW.feedback_timestamp
+BEGIN
+{_stat_contribution("OLD", "-")}
+{_stat_contribution("NEW", "+")}
+END""",
+    "stats_after_delete": f"""
+CREATE TRIGGER IF NOT EXISTS stats_after_delete AFTER DELETE ON predictions
+BEGIN
+{_stat_contribution("OLD", "-")}
+END""",
+}
+
+# Stored in PRAGMA user_version; bump it whenever STAT_TRIGGERS change, so
+# existing databases replace their triggers and recount the aggregates
+STATS_VERSION = 2
 
 
 class FashionDB:
-    """JSON-based database handler for storing predictions and feedback"""
-    
-    def __init__(self, db_path: str = "data/predictions.json"):
+    """SQLite-based database handler for storing predictions and feedback
+
+    The database runs in WAL mode, so inserts and feedback updates are
+    single indexed writes, readers never block the writer, and several
+    threads, Flask workers or processes can write at the same time.
+    """
+
+    def __init__(self, db_path: str = "data/predictions.db"):
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
         self._init_db()
-    
+        metrics.gauge("fashion_db_records", "Number of prediction records").set_function(self.count_predictions)
+        metrics.gauge("fashion_db_bytes", "Size of the database files on disk").set_function(self.size_bytes)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection (connections are not shared across threads or forks)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
     def _init_db(self):
-        """Initialize JSON file if it doesn't exist"""
-        if not self.db_path.exists():
-            self._write_data({"predictions": []})
-    
-    def _read_data(self) -> Dict:
-        """Read data from JSON file"""
+        """Create the schema if it doesn't exist"""
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.execute("BEGIN IMMEDIATE")
         try:
-            with open(self.db_path, 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {"predictions": []}
-    
-    def _write_data(self, data: Dict):
-        """Write data to JSON file"""
-        with open(self.db_path, 'w') as f:
-            json.dump(data, f, indent=2)
-    
+            outdated = conn.execute("PRAGMA user_version").fetchone()[0] < STATS_VERSION
+            for name, trigger in STAT_TRIGGERS.items():
+                if outdated:
+                    conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+                conn.execute(trigger)
+            built = conn.execute("SELECT 1 FROM stat_totals WHERE name = 'predictions'").fetchone()
+            if not built or outdated:
+                self._rebuild_statistics(conn)
+                conn.execute(f"PRAGMA user_version = {STATS_VERSION}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _rebuild_statistics(conn: sqlite3.Connection):
+        """Recompute the aggregate tables from scratch (databases created before they existed)"""
+        for table in ("stat_totals", "stat_style_counts", "stat_confusion", "stat_rollups"):
+            conn.execute(f"DELETE FROM {table}")
+        conn.execute(
+            """INSERT INTO stat_totals (name, value)
+               SELECT 'predictions', COUNT(*) FROM predictions
+               UNION ALL SELECT 'feedback', COUNT(user_correction) FROM predictions"""
+        )
+        conn.execute(
+            """INSERT INTO stat_style_counts (kind, style, count)
+               SELECT 'prediction', top_prediction, COUNT(*) FROM predictions GROUP BY top_prediction
+               UNION ALL
+               SELECT 'correction', user_correction, COUNT(*) FROM predictions
+               WHERE user_correction IS NOT NULL GROUP BY user_correction"""
+        )
+        conn.execute(
+            """INSERT INTO stat_confusion (predicted, corrected, count)
+               SELECT top_prediction, user_correction, COUNT(*) FROM predictions
+               WHERE user_correction IS NOT NULL GROUP BY top_prediction, user_correction"""
+        )
+        for granularity, length in ROLLUP_BUCKETS.items():
+            conn.execute(
+                """INSERT INTO stat_rollups (granularity, bucket, predictions, feedback)
+                   SELECT ?, bucket, SUM(predictions), SUM(feedback) FROM (
+                       SELECT substr(timestamp, 1, ?) AS bucket, 1 AS predictions, 0 AS feedback FROM predictions
+                       UNION ALL
+                       SELECT substr(COALESCE(feedback_timestamp, timestamp), 1, ?), 0, 1
+                       FROM predictions WHERE user_correction IS NOT NULL
+                   ) GROUP BY bucket""",
+                (granularity, length, length),
+            )
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict:
+        record = dict(row)
+        record["all_predictions"] = json.loads(record["all_predictions"])
+        return record
+
+    def migrate_json(self, json_path: str = "data/predictions.json") -> int:
+        """
+        One-shot import of the legacy JSON database
+
+        Records already present are skipped, and the JSON file is renamed
+        to *.migrated afterwards so the import never runs twice.
+
+        Args:
+            json_path: Path to the old predictions.json file
+
+        Returns:
+            Number of records imported
+        """
+        json_path = Path(json_path)
+        if not json_path.exists():
+            return 0
+        try:
+            with open(json_path, 'r') as f:
+                records = json.load(f).get("predictions", [])
+        except FileNotFoundError:
+            return 0  # another worker migrated it first
+        except json.JSONDecodeError as e:
+            print(f"Could not migrate {json_path}: {e}")
+            return 0
+
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            imported = 0
+            for record in records:
+                cursor = conn.execute(
+                    """INSERT OR IGNORE INTO predictions (
+                        record_id, timestamp, image_path, overlay_path, top_prediction,
+                        top_confidence, all_predictions, user_correction, feedback_timestamp
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (
+                        record["record_id"],
+                        record["timestamp"],
+                        record.get("image_path"),
+                        record.get("overlay_path"),
+                        record["top_prediction"],
+                        record["top_confidence"],
+                        json.dumps(record.get("all_predictions", [])),
+                        record.get("user_correction"),
+                        record.get("feedback_timestamp"),
+                    ),
+                )
+                imported += cursor.rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        try:
+            json_path.rename(json_path.with_suffix(json_path.suffix + ".migrated"))
+        except FileNotFoundError:
+            # Another worker imported the same records and renamed it first
+            return 0
+        print(f"Migrated {imported} records from {json_path} to {self.db_path}")
+        return imported
+
     def save_prediction(
         self,
         record_id: str,
         image_path: str,
         overlay_path: str,
-        predictions: List[Dict]
+        predictions: List[Dict],
+        timestamp: Optional[str] = None
     ) -> bool:
         """
         Save a new prediction to the database
-        
+
         Args:
             record_id: Unique identifier for this prediction
             image_path: Path to anonymized overlay image
             overlay_path: Path to segmentation overlay
             predictions: List of style predictions with scores
-        
+            timestamp: ISO capture time (defaults to now)
+
         Returns:
             True if successful
         """
         try:
-            data = self._read_data()
-            
-            prediction_record = {
-                "record_id": record_id,
-                "timestamp": datetime.now().isoformat(),
-                "image_path": image_path,
-                "overlay_path": overlay_path,
-                "top_prediction": predictions[0]["name"],
-                "top_confidence": predictions[0]["score"],
-                "all_predictions": predictions,
-                "user_correction": None,
-                "feedback_timestamp": None
-            }
-            
-            data["predictions"].append(prediction_record)
-            self._write_data(data)
+            with metrics.stage("db_write"):
+                self._connect().execute(
+                    """INSERT INTO predictions (
+                        record_id, timestamp, image_path, overlay_path, top_prediction,
+                        top_confidence, all_predictions, user_correction, feedback_timestamp
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, NULL, NULL)""",
+                    (
+                        record_id,
+                        timestamp or datetime.now().isoformat(),
+                        image_path,
+                        overlay_path,
+                        predictions[0]["name"],
+                        predictions[0]["score"],
+                        json.dumps(predictions),
+                    ),
+                )
             return True
         except Exception as e:
             print(f"Error saving prediction: {e}")
             return False
-    
-    def save_feedback(self, record_id: str, user_correction: str) -> bool:
+
+    def save_feedback(self, record_id: str, user_correction: str, timestamp: Optional[str] = None) -> bool:
         """
         Save user feedback/correction for a prediction
-        
+
         Args:
             record_id: The record to update
             user_correction: The style the user says is correct
-        
+            timestamp: ISO feedback time (defaults to now)
+
         Returns:
             True if successful
         """
         try:
-            data = self._read_data()
-            
-            for prediction in data["predictions"]:
-                if prediction["record_id"] == record_id:
-                    prediction["user_correction"] = user_correction
-                    prediction["feedback_timestamp"] = datetime.now().isoformat()
-                    break
-            
-            self._write_data(data)
-            return True
+            with metrics.stage("db_write"):
+                cursor = self._connect().execute(
+                    "UPDATE predictions SET user_correction = ?, feedback_timestamp = ? WHERE record_id = ?",
+                    (user_correction, timestamp or datetime.now().isoformat(), record_id),
+                )
+            return cursor.rowcount > 0
         except Exception as e:
             print(f"Error saving feedback: {e}")
             return False
-    
+
+    def update_predictions(self, updates: List[Tuple[str, List[Dict]]]) -> int:
+        """
+        Replace the predictions of existing records in a single transaction
+
+        Used by the batch re-classifier. The statistics triggers run per row,
+        so the running aggregates stay consistent with the new predictions.
+
+        Args:
+            updates: (record_id, predictions) pairs
+
+        Returns:
+            Number of records updated
+        """
+        conn = self._connect()
+        with metrics.stage("db_write"):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = conn.executemany(
+                    """UPDATE predictions SET top_prediction = ?, top_confidence = ?, all_predictions = ?
+                       WHERE record_id = ?""",
+                    [
+                        (predictions[0]["name"], predictions[0]["score"], json.dumps(predictions), record_id)
+                        for record_id, predictions in updates
+                    ],
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return cursor.rowcount
+
+    def get_image_paths(self, after: Optional[str] = None) -> List[Tuple[str, str]]:
+        """(record_id, image_path) of every record with a saved image, in record_id order"""
+        rows = self._connect().execute(
+            """SELECT record_id, image_path FROM predictions
+               WHERE image_path IS NOT NULL AND record_id > ? ORDER BY record_id""",
+            (after or "",),
+        ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def get_record_ids(self, after: Optional[str] = None) -> List[str]:
+        """record_id of every record, saved image or not, in record_id order"""
+        rows = self._connect().execute(
+            "SELECT record_id FROM predictions WHERE record_id > ? ORDER BY record_id", (after or "",)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def get_oldest_images(self, column: str = "image_path", limit: int = 100) -> List[str]:
+        """
+        Stored image files, oldest record first
+
+        Walks a partial timestamp index, so each call only reads records that
+        still have an image. A file shared by several records (a retake served
+        from the frame cache, seconds apart) comes up with its oldest record.
+
+        Args:
+            column: "image_path" (full-size images) or "overlay_path" (any overlay,
+                including thumbnails left after a full-size image was evicted)
+            limit: Most rows to read (fewer paths come back when some are shared)
+        """
+        if column not in ("image_path", "overlay_path"):
+            raise ValueError(f"Unknown image column: {column}")
+        rows = self._connect().execute(
+            f"""SELECT {column} FROM predictions WHERE {column} IS NOT NULL AND {column} != ''
+                ORDER BY timestamp, record_id LIMIT ?""",
+            (limit,),
+        ).fetchall()
+        return list(dict.fromkeys(row[0] for row in rows))
+
+    def replace_image(self, path: str, image_path: Optional[str], overlay_path: Optional[str]) -> int:
+        """
+        Point every record that references an image file at new files (None = no image)
+
+        Returns:
+            Number of records updated
+        """
+        with metrics.stage("db_write"):
+            cursor = self._connect().execute(
+                "UPDATE predictions SET image_path = ?, overlay_path = ? WHERE image_path = ? OR overlay_path = ?",
+                (image_path, overlay_path, path, path),
+            )
+        return cursor.rowcount
+
+    def count_predictions(self) -> int:
+        """Number of stored predictions (read from the running totals)"""
+        row = self._connect().execute(
+            "SELECT value FROM stat_totals WHERE name = 'predictions'"
+        ).fetchone()
+        return row[0] if row else 0
+
+    def size_bytes(self) -> int:
+        """Size of the database file plus its write-ahead log"""
+        total = 0
+        for suffix in ("", "-wal"):
+            path = Path(str(self.db_path) + suffix)
+            if path.exists():
+                total += path.stat().st_size
+        return total
+
     def get_prediction(self, record_id: str) -> Optional[Dict]:
         """Get a prediction by record_id"""
-        data = self._read_data()
-        for prediction in data["predictions"]:
-            if prediction["record_id"] == record_id:
-                return prediction
-        return None
-    
+        row = self._connect().execute(
+            "SELECT * FROM predictions WHERE record_id = ?", (record_id,)
+        ).fetchone()
+        return self._row_to_dict(row) if row else None
+
     def get_all_predictions(self, limit: int = 100) -> List[Dict]:
         """Get all predictions, most recent first"""
-        data = self._read_data()
-        predictions = data["predictions"]
-        # Sort by timestamp descending
-        predictions.sort(key=lambda x: x["timestamp"], reverse=True)
-        return predictions[:limit]
-    
-    def get_statistics(self) -> Dict:
-        """Get database statistics"""
-        data = self._read_data()
-        predictions = data["predictions"]
-        
-        total_predictions = len(predictions)
-        total_feedback = sum(1 for p in predictions if p["user_correction"] is not None)
-        
-        # Count top predictions
-        top_pred_counts = {}
-        for p in predictions:
-            style = p["top_prediction"]
-            top_pred_counts[style] = top_pred_counts.get(style, 0) + 1
-        
-        top_predictions = sorted(top_pred_counts.items(), key=lambda x: x[1], reverse=True)
-        
-        # Count user corrections
-        correction_counts = {}
-        for p in predictions:
-            if p["user_correction"]:
-                style = p["user_correction"]
-                correction_counts[style] = correction_counts.get(style, 0) + 1
-        
-        corrections = sorted(correction_counts.items(), key=lambda x: x[1], reverse=True)
-        
-        return {
+        rows = self._connect().execute(
+            "SELECT * FROM predictions ORDER BY timestamp DESC, record_id DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def get_predictions_page(
+        self, limit: int = 50, cursor: Optional[Tuple[str, str]] = None
+    ) -> Tuple[List[Dict], Optional[Tuple[str, str]]]:
+        """
+        One page of predictions, most recent first
+
+        Seeks on the (timestamp, record_id) index instead of using OFFSET, so
+        every page costs the same however deep into the history it is, and
+        records inserted meanwhile never shift or repeat entries.
+
+        Args:
+            limit: Records per page
+            cursor: (timestamp, record_id) of the last record of the previous
+                page, or None for the first page
+
+        Returns:
+            (records, cursor for the next page or None after the last page)
+        """
+        if cursor is None:
+            rows = self._connect().execute(
+                "SELECT * FROM predictions ORDER BY timestamp DESC, record_id DESC LIMIT ?", (limit + 1,)
+            ).fetchall()
+        else:
+            rows = self._connect().execute(
+                """SELECT * FROM predictions WHERE (timestamp, record_id) < (?, ?)
+                   ORDER BY timestamp DESC, record_id DESC LIMIT ?""",
+                (cursor[0], cursor[1], limit + 1),
+            ).fetchall()
+        records = [self._row_to_dict(row) for row in rows[:limit]]
+        has_more = len(rows) > limit
+        return records, ((records[-1]["timestamp"], records[-1]["record_id"]) if has_more else None)
+
+    def iter_predictions(self, page_size: int = 1000) -> Iterator[List[Dict]]:
+        """Every prediction, most recent first, one page at a time (bounded memory)"""
+        cursor = None
+        while True:
+            records, cursor = self.get_predictions_page(page_size, cursor)
+            if records:
+                yield records
+            if cursor is None:
+                return
+
+    def get_statistics(self, rollup: Optional[str] = None, rollup_limit: int = 24) -> Dict:
+        """
+        Get database statistics
+
+        Reads the running aggregates maintained at write time, so the cost
+        depends on the number of styles, not on the size of the history.
+
+        Args:
+            rollup: Optional time bucket ("hour" or "day") for activity rollups
+            rollup_limit: Number of most recent buckets to return
+
+        Returns:
+            Totals, feedback rate, per-style counts, the predicted -> corrected
+            confusion matrix and (optionally) time-bucketed rollups
+        """
+        conn = self._connect()
+        totals = dict(conn.execute("SELECT name, value FROM stat_totals").fetchall())
+        total_predictions = totals.get("predictions", 0)
+        total_feedback = totals.get("feedback", 0)
+
+        style_counts = {"prediction": [], "correction": []}
+        for kind, style, count in conn.execute(
+            "SELECT kind, style, count FROM stat_style_counts WHERE count > 0 ORDER BY count DESC, style"
+        ):
+            style_counts[kind].append((style, count))
+
+        confusion = [
+            (predicted, corrected, count) for predicted, corrected, count in conn.execute(
+                """SELECT predicted, corrected, count FROM stat_confusion
+                   WHERE count > 0 ORDER BY count DESC, predicted, corrected"""
+            )
+        ]
+
+        stats = {
             "total_predictions": total_predictions,
             "total_feedback": total_feedback,
             "feedback_rate": total_feedback / total_predictions if total_predictions > 0 else 0,
-            "top_predictions": top_predictions,
-            "user_corrections": corrections
+            "top_predictions": style_counts["prediction"],
+            "user_corrections": style_counts["correction"],
+            "confusion_matrix": confusion
         }
+
+        if rollup is not None:
+            if rollup not in ROLLUP_BUCKETS:
+                raise ValueError(f"Unknown rollup {rollup!r}, expected one of {list(ROLLUP_BUCKETS)}")
+            rows = conn.execute(
+                """SELECT bucket, predictions, feedback FROM stat_rollups
+                   WHERE granularity = ? ORDER BY bucket DESC LIMIT ?""",
+                (rollup, rollup_limit),
+            ).fetchall()
+            stats["rollups"] = [tuple(row) for row in rows]
+
+        return stats
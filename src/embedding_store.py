@@ -0,0 +1,232 @@
+"""
+Embedding store for Fashion Police
+Keeps every record's normalized CLIP image embedding on disk
+
+Embeddings live in one float16 matrix file (`embeddings.f16`, one row per
+record) that is read through `numpy.memmap`, with a small SQLite index
+mapping record_id -> row. Re-scoring the whole history against an edited
+style set is then one chunked matrix multiply instead of a CLIP forward
+pass per image, and "outfits similar to this one" is a dot product.
+
+Several processes may write at once: a row number is allocated and the
+vector written inside an IMMEDIATE transaction, so rows never overlap and
+the index only ever points at fully written rows.
+"""
+
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from . import config, metrics
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embedding_rows (
+    record_id TEXT PRIMARY KEY,
+    row INTEGER NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS embedding_meta (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Rows per matrix multiply when scanning the whole store (~32MB of float32 at 512 dims)
+CHUNK_ROWS = 16384
+
+
+class EmbeddingStore:
+    """Memory-mappable float16 matrix of image embeddings keyed by record_id"""
+
+    def __init__(self, directory: Path = config.EMBEDDING_STORE_DIR, model_id: str = ""):
+        """
+        Args:
+            directory: Where the matrix and its index live
+            model_id: Model the embeddings come from; writing embeddings of
+                another model (or dimension) into the same store is refused
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.matrix_path = self.directory / "embeddings.f16"
+        self.index_path = self.directory / "index.db"
+        self.model_id = model_id
+        self._local = threading.local()
+        self._connect().executescript(SCHEMA)
+        self._map: Optional[np.memmap] = None
+        self._map_key: Tuple[int, int] = (0, 0)
+        self._map_lock = threading.Lock()
+        metrics.gauge("fashion_embeddings", "Records with a stored image embedding").set_function(self.__len__)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Per-thread, per-process connection (same pattern as FashionDB)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _meta(self, name: str) -> Optional[str]:
+        row = self._connect().execute("SELECT value FROM embedding_meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    @property
+    def dim(self) -> Optional[int]:
+        dim = self._meta("dim")
+        return int(dim) if dim else None
+
+    @property
+    def model(self) -> Optional[str]:
+        """Model the stored embeddings came from (None while the store is empty)"""
+        return self._meta("model")
+
+    def __len__(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM embedding_rows").fetchone()[0]
+
+    def __contains__(self, record_id: str) -> bool:
+        return self._connect().execute(
+            "SELECT 1 FROM embedding_rows WHERE record_id = ?", (record_id,)
+        ).fetchone() is not None
+
+    def put(self, record_id: str, embedding: np.ndarray):
+        """Store (or replace) one record's embedding"""
+        self.put_many([(record_id, embedding)])
+
+    def put_many(self, items: Iterable[Tuple[str, np.ndarray]]):
+        """Store several embeddings in one transaction"""
+        items = [(record_id, np.asarray(embedding, dtype=np.float16).ravel()) for record_id, embedding in items]
+        if not items:
+            return
+        conn = self._connect()
+        with metrics.stage("embedding_write"):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._check_meta(conn, items[0][1].size)
+                next_row = conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM embedding_rows").fetchone()[0]
+                fd = os.open(self.matrix_path, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    for record_id, vector in items:
+                        existing = conn.execute(
+                            "SELECT row FROM embedding_rows WHERE record_id = ?", (record_id,)
+                        ).fetchone()
+                        row = existing[0] if existing else next_row
+                        os.pwrite(fd, vector.tobytes(), row * vector.nbytes)
+                        if not existing:
+                            conn.execute(
+                                "INSERT INTO embedding_rows (record_id, row) VALUES (?, ?)", (record_id, row)
+                            )
+                            next_row += 1
+                finally:
+                    os.close(fd)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def clear(self):
+        """Drop every embedding, e.g. before re-embedding the history with another model"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM embedding_rows")
+            conn.execute("DELETE FROM embedding_meta")
+            if self.matrix_path.exists():
+                # Swap in an empty file rather than truncating: other processes may
+                # have the old one mapped, and reading a truncated mapping is a SIGBUS
+                tmp_path = self.matrix_path.with_suffix(f".tmp{os.getpid()}")
+                open(tmp_path, "wb").close()
+                os.replace(tmp_path, self.matrix_path)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _check_meta(self, conn: sqlite3.Connection, dim: int):
+        meta = dict(conn.execute("SELECT name, value FROM embedding_meta").fetchall())
+        if not meta:
+            conn.executemany(
+                "INSERT INTO embedding_meta (name, value) VALUES (?, ?)",
+                [("dim", str(dim)), ("model", self.model_id)],
+            )
+            return
+        if int(meta["dim"]) != dim or (self.model_id and meta["model"] and meta["model"] != self.model_id):
+            raise ValueError(
+                f"Embedding store {self.directory} holds {meta['model'] or 'unknown'} embeddings of size "
+                f"{meta['dim']}, refusing {self.model_id or 'unknown'} embeddings of size {dim}"
+            )
+
+    def _matrix(self) -> Optional[np.memmap]:
+        """Read-only memmap of the whole matrix, re-mapped when it has grown or been replaced by clear()"""
+        dim = self.dim
+        try:
+            stat = self.matrix_path.stat()
+        except FileNotFoundError:
+            return None
+        if dim is None:
+            return None
+        rows = stat.st_size // (dim * 2)
+        with self._map_lock:
+            if self._map is None or (stat.st_ino, rows) != self._map_key:
+                self._map = np.memmap(self.matrix_path, dtype=np.float16, mode="r", shape=(rows, dim)) if rows else None
+                self._map_key = (stat.st_ino, rows)
+            return self._map
+
+    def get(self, record_id: str) -> Optional[np.ndarray]:
+        """The stored embedding as float32, or None"""
+        found = self._connect().execute(
+            "SELECT row FROM embedding_rows WHERE record_id = ?", (record_id,)
+        ).fetchone()
+        matrix = self._matrix()
+        if found is None or matrix is None or found[0] >= len(matrix):
+            return None
+        return np.asarray(matrix[found[0]], dtype=np.float32)
+
+    def rows(self, record_ids: Optional[List[str]] = None) -> Tuple[List[str], np.ndarray]:
+        """(record_ids, row numbers) for the given records (all when None), in row order"""
+        conn = self._connect()
+        if record_ids is None:
+            found = conn.execute("SELECT record_id, row FROM embedding_rows ORDER BY row").fetchall()
+        else:
+            found = []
+            for start in range(0, len(record_ids), 500):
+                chunk = record_ids[start:start + 500]
+                found += conn.execute(
+                    f"SELECT record_id, row FROM embedding_rows WHERE record_id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+            found.sort(key=lambda item: item[1])
+        return [record_id for record_id, _ in found], np.array([row for _, row in found], dtype=np.int64)
+
+    def iter_chunks(
+        self, record_ids: Optional[List[str]] = None, chunk_rows: int = CHUNK_ROWS
+    ) -> Iterator[Tuple[List[str], np.ndarray]]:
+        """
+        Yield (record_ids, float32 embeddings) in chunks straight from the
+        memmap, so scoring the whole history is one matrix multiply per chunk
+        """
+        ids, rows = self.rows(record_ids)
+        matrix = self._matrix()
+        if matrix is None or not ids:
+            return
+        for start in range(0, len(ids), chunk_rows):
+            chunk_rows_idx = rows[start:start + chunk_rows]
+            yield ids[start:start + chunk_rows], np.asarray(matrix[chunk_rows_idx], dtype=np.float32)
+
+    def nearest(self, record_id: str, k: int = 5) -> List[Tuple[str, float]]:
+        """The k records whose outfits look most like `record_id`'s, with cosine similarity"""
+        query = self.get(record_id)
+        if query is None:
+            return []
+        best: List[Tuple[float, str]] = []
+        for ids, embeds in self.iter_chunks():
+            scores = embeds @ query
+            top = np.argsort(-scores)[:k + 1]
+            best += [(float(scores[i]), ids[i]) for i in top if ids[i] != record_id]
+            best = sorted(best, reverse=True)[:k]
+        return [(other_id, score) for score, other_id in best]
@@ -0,0 +1,140 @@
+"""
+Frame cache for Fashion Police
+Reuses the last results when a visitor retakes almost the same photo
+
+Each prepared frame is reduced to a perceptual difference hash (dHash) of
+the whole frame and of the person crop. A new frame whose hashes are within
+`max_distance` differing bits of a recent one gets that frame's predictions,
+overlays and embedding back without running either model.
+
+Results are only shared between frames classified the same way: the caller
+passes a `variant` (pipeline mode and working resolution), so a degraded
+result is never served to a full-quality request or the other way round.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+from PIL import Image
+
+from . import config, metrics
+from .scripts.preprocess import PreparedImage
+
+
+LOOKUPS = metrics.counter("fashion_frame_cache_lookups_total", "Frame cache lookups", ("result",))
+DISTANCE = metrics.histogram(
+    "fashion_frame_cache_distance_bits",
+    "Hamming distance from each frame to the closest cached frame (for tuning the threshold)",
+    buckets=(0, 2, 4, 8, 12, 16, 24, 32, 48, 64, 128),
+)
+
+# dHash grid: 8 rows of 8 left/right brightness comparisons = 64 bits
+_HASH_SIZE = 8
+
+
+def dhash(image: Image.Image) -> int:
+    """64-bit difference hash: does each pixel of a 9x8 thumbnail get brighter to the right?"""
+    small = image.resize((_HASH_SIZE + 1, _HASH_SIZE), Image.BILINEAR, reducing_gap=2.0).convert("L")
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(_HASH_SIZE):
+        offset = row * (_HASH_SIZE + 1)
+        for col in range(_HASH_SIZE):
+            bits = (bits << 1) | (pixels[offset + col + 1] > pixels[offset + col])
+    return bits
+
+
+def frame_key(image: PreparedImage) -> int:
+    """128-bit key: hash of the whole frame followed by the hash of the person crop"""
+    with metrics.stage("frame_hash"):
+        return (dhash(image.frame) << 64) | dhash(image.crop)
+
+
+class FrameCache:
+    """Recent classification results, looked up by perceptual similarity
+
+    Entries are kept in LRU order, bounded by a byte budget (the two
+    overlays dominate) and a TTL. Lookups scan every entry, which is cheap
+    for the handful of frames a short TTL keeps around.
+    """
+
+    def __init__(
+        self,
+        max_distance: int = config.FRAME_CACHE_MAX_DISTANCE,
+        ttl_seconds: float = config.FRAME_CACHE_TTL_SECONDS,
+        max_bytes: int = config.FRAME_CACHE_MAX_BYTES,
+    ):
+        """
+        Args:
+            max_distance: Most differing hash bits (of 128) that still count as the same photo;
+                below 0 disables the cache
+            ttl_seconds: How long a frame's results can be reused
+            max_bytes: Memory budget for cached overlays
+        """
+        self.max_distance = max_distance
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[Hashable, int], Tuple[float, int, Tuple]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_distance >= 0 and self.max_bytes > 0
+
+    def get(self, key: int, variant: Hashable = None) -> Optional[Tuple]:
+        """The cached `classify()` result of the closest recent frame of the same variant within the threshold, or None"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            best_key, best_distance = None, None
+            for cached_key in self._entries:
+                if cached_key[0] != variant:
+                    continue
+                distance = (cached_key[1] ^ key).bit_count()
+                if best_distance is None or distance < best_distance:
+                    best_key, best_distance = cached_key, distance
+            if best_distance is not None:
+                DISTANCE.observe(best_distance)
+            if best_key is None or best_distance > self.max_distance:
+                LOOKUPS.inc(result="miss")
+                return None
+            self._entries.move_to_end(best_key)
+            LOOKUPS.inc(result="hit")
+            return self._entries[best_key][2]
+
+    def put(self, key: int, result: Tuple, variant: Hashable = None):
+        """Cache a `classify()` result (predictions, display overlay, anonymized overlay, embedding)"""
+        if not self.enabled:
+            return
+        size = sum(overlay.width * overlay.height * len(overlay.getbands()) for overlay in result[1:3])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove((variant, key))
+            self._entries[(variant, key)] = (time.time(), size, result)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: Tuple[Hashable, int]):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def _expire(self, now: float):
+        # Oldest-used first, but a recently hit entry can still be old: check them all
+        for key in [key for key, (created, _, _) in self._entries.items() if now - created > self.ttl_seconds]:
+            self._remove(key)
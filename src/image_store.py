@@ -0,0 +1,234 @@
+"""
+Image store for Fashion Police
+Content-addressed anonymized overlays, cached thumbnails and a disk budget
+
+Full-size overlays are stored once per distinct content under
+`full/<ab>/<sha256>.<ext>` (a retake served from the frame cache shares the
+file), and small WebP thumbnails are made on first request under
+`thumbs/<size>/<ab>/<name>.webp` and kept until their image is evicted.
+
+When the store grows past its byte budget, the oldest images are evicted:
+first their full-size versions (the record keeps its thumbnail, which
+becomes its `overlay_path`), then - if that is still not enough, or with
+`evict="all"` - the thumbnails too. FashionDB is updated in the same step,
+so a record never points at a deleted file.
+"""
+
+import hashlib
+import io
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image
+
+from . import config, metrics
+from .database import FashionDB
+
+
+STORE_BYTES = metrics.gauge("fashion_image_store_bytes", "Disk used by stored overlays and thumbnails")
+EVICTED = metrics.counter("fashion_images_evicted_total", "Images removed to stay within the disk budget", ("tier",))
+
+_EXTENSIONS = {"JPEG": ".jpg", "WEBP": ".webp"}
+
+
+def image_mimetype(data: bytes) -> str:
+    """Mimetype of encoded image bytes (the store writes JPEG and WebP)"""
+    return "image/webp" if data[8:12] == b"WEBP" else "image/jpeg"
+
+
+class ImageStore:
+    """Content-addressed overlay files with lazy thumbnails and a retention budget"""
+
+    def __init__(
+        self,
+        db: FashionDB,
+        root: Path = config.IMAGE_STORE_DIR,
+        image_format: str = config.IMAGE_FORMAT,
+        quality: int = config.IMAGE_QUALITY,
+        thumbnail_size: int = config.THUMBNAIL_SIZE,
+        max_bytes: int = config.IMAGE_STORE_MAX_BYTES,
+        evict: str = config.IMAGE_EVICT,
+    ):
+        """
+        Args:
+            db: Database whose image references are kept consistent
+            root: Directory for full images and thumbnails
+            image_format: "jpeg" or "webp" for full-size images
+            quality: Encoder quality for full-size images
+            thumbnail_size: Longest side of thumbnails
+            max_bytes: Disk budget for everything under root (0 = unlimited)
+            evict: "full" drops full-size images before thumbnails, "all"
+                drops both at once
+        """
+        if image_format.upper() not in _EXTENSIONS:
+            raise ValueError(f"image_format must be 'jpeg' or 'webp', got {image_format!r}")
+        if evict not in ("full", "all"):
+            raise ValueError(f"evict must be 'full' or 'all', got {evict!r}")
+        self.db = db
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.image_format = image_format.upper()
+        self.quality = quality
+        self.thumbnail_size = thumbnail_size
+        self.max_bytes = max_bytes
+        self.evict = evict
+        self._thumbs = self.root / "thumbs" / str(thumbnail_size)
+        self._usage: Optional[int] = None
+        self._lock = threading.Lock()
+        STORE_BYTES.set_function(lambda: self._usage or 0)
+
+    # Writing -------------------------------------------------------------
+
+    def put(self, image: Image.Image) -> str:
+        """
+        Store a full-size overlay
+
+        Returns:
+            Its path (identical content always maps to the same file)
+        """
+        path, data = self._encode(image)
+        if not path.exists():
+            self._write(path, data)
+        return str(path)
+
+    def ensure(self, image_path: str, image: Image.Image, record_id: str) -> bool:
+        """
+        Write a stored image again if it is gone but its record still uses it
+
+        `put` reuses the file of identical content, which another worker may
+        evict before the record referencing it is saved; called once that
+        record is committed, this puts the file back. (If the eviction has
+        already pointed the record at the thumbnail, it is left that way.)
+
+        Returns:
+            True if the file had to be rewritten
+        """
+        if Path(image_path).exists():
+            return False
+        record = self.db.get_prediction(record_id)
+        if record is None or record["image_path"] != image_path:
+            return False
+        self._write(Path(image_path), self._encode(image)[1])
+        return True
+
+    def _encode(self, image: Image.Image):
+        buffer = io.BytesIO()
+        image.save(buffer, format=self.image_format, quality=self.quality)
+        data = buffer.getvalue()
+        digest = hashlib.sha256(data).hexdigest()
+        return self.root / "full" / digest[:2] / (digest + _EXTENSIONS[self.image_format]), data
+
+    def thumbnail(self, image_path: str) -> Optional[Path]:
+        """
+        Path of the WebP thumbnail of a stored image, made on first use
+
+        Returns None when neither the thumbnail nor the full image exists.
+        """
+        source = Path(image_path)
+        if self._thumbs in source.parents:
+            return source if source.exists() else None  # the full image was evicted
+        path = self._thumbnail_path(source)
+        if path.exists():
+            return path
+        size = self.thumbnail_size
+        try:
+            with metrics.stage("thumbnail"), Image.open(source) as image:
+                image.draft("RGB", (size, size))
+                image = image.convert("RGB")
+                image.thumbnail((size, size), Image.BILINEAR)
+                buffer = io.BytesIO()
+                image.save(buffer, format="WEBP", quality=75, method=4)
+        except OSError:
+            return None
+        self._write(path, buffer.getvalue())
+        return path
+
+    def _thumbnail_path(self, source: Path) -> Path:
+        return self._thumbs / source.stem[:2] / (source.stem + ".webp")
+
+    def _write(self, path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".tmp{os.getpid()}.{threading.get_ident()}")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._usage is not None:
+                self._usage += len(data)
+
+    # Retention -----------------------------------------------------------
+
+    @property
+    def over_budget(self) -> bool:
+        return self.max_bytes > 0 and self.usage() > self.max_bytes
+
+    def usage(self, rescan: bool = False) -> int:
+        """Bytes used under root (scanned once, then tracked as files are added and removed)"""
+        with self._lock:
+            if self._usage is None or rescan:
+                total = 0
+                for directory, _, files in os.walk(self.root):
+                    for name in files:
+                        try:
+                            total += os.stat(os.path.join(directory, name)).st_size
+                        except FileNotFoundError:
+                            pass
+                self._usage = total
+            return self._usage
+
+    def enforce_budget(self) -> int:
+        """
+        Evict the oldest images until usage is back under 90% of the budget
+
+        Returns:
+            Number of files removed
+        """
+        if self.max_bytes <= 0:
+            return 0
+        # Other worker processes write and evict too: start from the real size
+        target = int(self.max_bytes * 0.9)
+        if self.usage(rescan=True) <= target:
+            return 0
+        removed = 0
+        tiers = ["image_path", "overlay_path"] if self.evict == "full" else ["overlay_path"]
+        for column in tiers:
+            while self.usage() > target:
+                oldest = self.db.get_oldest_images(column, limit=100)
+                if not oldest:
+                    break
+                for path in oldest:
+                    if self.usage() <= target:
+                        break
+                    removed += self._evict(column, path)
+        print(f"Image store over budget: removed {removed} files, {self.usage() / 1e6:.0f}MB in use")
+        return removed
+
+    def _evict(self, column: str, path: str) -> int:
+        """Remove one stored image from disk and from every record referencing it"""
+        if column == "image_path":
+            # Keep a thumbnail in place of the full-size version
+            thumbnail = self.thumbnail(path)
+            overlay_path = str(thumbnail) if thumbnail else None
+            files = [Path(path)]
+            EVICTED.inc(tier="full")
+        else:
+            overlay_path = None
+            files = [Path(path), self._thumbnail_path(Path(path))]
+            EVICTED.inc(tier="all")
+        self.db.replace_image(path, image_path=None, overlay_path=overlay_path)
+        count = 0
+        for file in files:
+            try:
+                size = file.stat().st_size
+                file.unlink()
+            except FileNotFoundError:
+                continue
+            count += 1
+            with self._lock:
+                if self._usage is not None:
+                    self._usage -= size
+        # A record sharing this file may have been saved meanwhile by another
+        # worker that checked for the file before it was removed
+        self.db.replace_image(path, image_path=None, overlay_path=overlay_path)
+        return count
@@ -0,0 +1,133 @@
+"""
+Model loader for Fashion Police
+Builds the outfit classifier in the background so the app is up instantly
+
+Importing the app no longer loads any models. The first request (or the
+dev server's start-up) kicks off a background thread that loads both models
+in parallel and runs a warm-up inference; until then `/ready` and
+`/process_image` answer 503 and the camera page shows a warming-up state.
+"""
+
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from . import config, metrics
+from .scripts.classify_outfit import OutfitClassifier
+
+
+MODELS_READY = metrics.gauge("fashion_models_ready", "1 once the models are loaded and warmed up")
+
+
+class ModelLoader:
+    """Loads the OutfitClassifier once, off the request path, and reports readiness"""
+
+    def __init__(
+        self,
+        factory: Callable[[], OutfitClassifier] = OutfitClassifier,
+        warm_up: bool = config.WARMUP,
+    ):
+        """
+        Args:
+            factory: Builds the classifier (and with it both models)
+            warm_up: Run one throwaway inference before reporting ready
+        """
+        self.factory = factory
+        self.warm_up = warm_up
+        self.state = "idle"  # idle -> loading -> warming -> ready | failed
+        self.error: Optional[str] = None
+        self._classifier: Optional[OutfitClassifier] = None
+        self._started_at: Optional[float] = None
+        self._load_seconds: Optional[float] = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        MODELS_READY.set_function(lambda: float(self.ready))
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def _claim(self) -> bool:
+        """Move from idle to loading; True for the one caller that should load"""
+        if self.state != "idle":
+            return False
+        with self._lock:
+            if self.state != "idle":
+                return False
+            self.state = "loading"
+            self._started_at = time.perf_counter()
+            return True
+
+    def start(self):
+        """Start loading in a background thread (no-op once started)"""
+        if self._claim():
+            threading.Thread(target=self._load, name="model-loader", daemon=True).start()
+
+    def load(self) -> OutfitClassifier:
+        """Load in the calling thread, or wait for a load already in progress"""
+        if self._claim():
+            self._load()
+        return self.get()
+
+    def get(self, timeout: Optional[float] = None) -> OutfitClassifier:
+        """Wait for the classifier; raises RuntimeError if loading failed or timed out"""
+        self.start()
+        if not self._done.wait(timeout):
+            raise RuntimeError("Models are still loading")
+        if self._classifier is None:
+            raise RuntimeError(f"Model loading failed: {self.error}")
+        return self._classifier
+
+    def rewarm(self):
+        """
+        Warm up again in the background in this process, e.g. in a freshly
+        forked server worker (thread pools and allocator caches are per process)
+        """
+        classifier = self.get()
+        self.state = "warming"
+
+        def run():
+            try:
+                classifier.warm_up()
+            except Exception as e:
+                print(f"Warm-up failed: {e}")
+            finally:
+                self.state = "ready"
+
+        threading.Thread(target=run, name="model-warm-up", daemon=True).start()
+
+    def classify_batch(self, images: List, **options):
+        """Lets the BatchScheduler use the loader in place of the classifier"""
+        return self.get().classify_batch(images, **options)
+
+    def status(self) -> Dict:
+        """Readiness summary served at /ready"""
+        if self._load_seconds is not None:
+            seconds = self._load_seconds
+        elif self._started_at is not None:
+            seconds = time.perf_counter() - self._started_at
+        else:
+            seconds = 0.0
+        return {
+            'ready': self.ready,
+            'state': self.state,
+            'seconds': round(seconds, 1),
+            'error': self.error,
+        }
+
+    def _load(self):
+        try:
+            classifier = self.factory()
+            if self.warm_up:
+                self.state = "warming"
+                classifier.warm_up()
+            self._classifier = classifier
+            self._load_seconds = time.perf_counter() - self._started_at
+            self.state = "ready"
+            print(f"Fashion Police is ready! (models loaded in {self._load_seconds:.1f}s)")
+        except Exception as e:
+            self.error = str(e)
+            self.state = "failed"
+            print(f"Error loading models: {e}")
+        finally:
+            self._done.set()
@@ -0,0 +1,367 @@
+"""
+Persistence module for Fashion Police
+Moves overlay encoding and database writes off the request path
+
+Requests hand their anonymized overlay, predictions and CLIP embedding to a
+background writer thread through a bounded queue, so the HTTP response can
+go out as soon as inference is done. Every queued operation is first appended to a
+per-process journal (fsynced JSON lines); on startup, operations that were
+queued but never completed are replayed into the database. Each journaled
+operation carries a unique "seq", which its completion marker refers to.
+"""
+
+import atexit
+import base64
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from . import config, metrics
+from .database import FashionDB
+from .embedding_store import EmbeddingStore
+from .image_store import ImageStore
+
+
+# Tries per queued operation before it is left in the journal for the next startup
+_WRITE_ATTEMPTS = 3
+# Seconds between checks for the record of feedback that arrived before it
+_FEEDBACK_RETRY = 0.5
+
+QUEUE_DEPTH = metrics.gauge("fashion_persist_queue_depth", "Operations waiting for the background writer")
+SYNC_FALLBACKS = metrics.counter(
+    "fashion_persist_sync_fallbacks_total", "Writes done on the request thread because the queue was full"
+)
+
+
+class PersistenceWriter:
+    """Background writer for anonymized overlays, predictions and feedback"""
+
+    def __init__(
+        self,
+        db: FashionDB,
+        images: ImageStore,
+        journal_dir: Path = config.JOURNAL_DIR,
+        max_queue: int = config.PERSIST_QUEUE_SIZE,
+        put_timeout: float = config.PERSIST_PUT_TIMEOUT,
+        feedback_wait: float = config.PERSIST_FEEDBACK_WAIT,
+        background: bool = config.BACKGROUND_PERSIST,
+        embeddings: Optional[EmbeddingStore] = None,
+    ):
+        """
+        Args:
+            db: Database the records are written to
+            images: Store for anonymized overlays (and their retention budget)
+            journal_dir: Directory for the crash-safe journals
+            max_queue: Bounded queue size; when full, submitters wait (backpressure)
+            put_timeout: Seconds a prediction waits for queue space before being written
+                synchronously (feedback always waits, so it stays behind its record's insert)
+            feedback_wait: Seconds feedback is held back while its record is missing
+                (under several workers, the insert may be queued in another one)
+            background: False writes everything on the calling thread (no queue or journal)
+            embeddings: Store for each record's image embedding (None = not kept)
+        """
+        self.db = db
+        self.images = images
+        self.journal_dir = Path(journal_dir)
+        self.journal_dir.mkdir(parents=True, exist_ok=True)
+        self.max_queue = max_queue
+        self.put_timeout = put_timeout
+        self.feedback_wait = feedback_wait
+        self.background = background
+        self.embeddings = embeddings
+
+        self._queue: "queue.Queue[Optional[Dict]]" = queue.Queue(maxsize=max_queue)
+        self._journal_lock = threading.Lock()
+        self._journal_file = None
+        self._journal_pending = 0
+        self._worker: Optional[threading.Thread] = None
+        self._worker_pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+        QUEUE_DEPTH.set_function(self._queue.qsize)
+        atexit.register(self.close)
+
+    def submit_prediction(
+        self,
+        record_id: str,
+        anonymized_overlay: Image.Image,
+        predictions: List[Dict],
+        embedding: Optional[np.ndarray] = None,
+    ):
+        """Queue the anonymized overlay, prediction record and image embedding for writing"""
+        operation = {
+            "op": "prediction",
+            "record_id": record_id,
+            "timestamp": datetime.now().isoformat(),
+            "predictions": predictions,
+        }
+        if embedding is not None and self.embeddings is not None:
+            # float16 is what the store keeps; base64 keeps the journal line small
+            operation["embedding"] = base64.b64encode(np.asarray(embedding, dtype=np.float16).tobytes()).decode("ascii")
+        self._submit(operation, anonymized_overlay)
+
+    def submit_feedback(self, record_id: str, user_correction: str):
+        """Queue a feedback update (written once the record's insert has landed)"""
+        self._submit({
+            "op": "feedback",
+            "record_id": record_id,
+            "user_correction": user_correction,
+            "timestamp": datetime.now().isoformat(),
+        })
+
+    def _submit(self, operation: Dict, image: Optional[Image.Image] = None):
+        if not self.background:
+            self._apply(operation, image)
+            return
+        self._ensure_worker()
+        self._journal_append(operation)
+        if operation["op"] == "feedback":
+            # Must not overtake its record's queued insert: wait for queue space
+            self._queue.put((operation, image))
+            return
+        try:
+            self._queue.put((operation, image), timeout=self.put_timeout)
+        except queue.Full:
+            # Writer can't keep up: do the work here rather than drop it
+            SYNC_FALLBACKS.inc()
+            self._write(operation, image)
+
+    def flush(self):
+        """Block until everything queued so far has been written"""
+        if self._worker is not None and self._worker_pid == os.getpid():
+            self._queue.join()
+
+    def close(self):
+        """Flush the queue and stop the writer thread"""
+        if self._worker is None or self._worker_pid != os.getpid() or not self._worker.is_alive():
+            return
+        self._queue.put(None)
+        self._worker.join()
+        self._worker = None
+
+    def _ensure_worker(self):
+        # Threads do not survive fork(), so start the writer lazily in the serving process
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+                return
+            if self._worker_pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.max_queue)
+                QUEUE_DEPTH.set_function(self._queue.qsize)
+                self._journal_file = None
+                self._journal_pending = 0
+            self._worker_pid = os.getpid()
+            self._worker = threading.Thread(target=self._run, name="persistence-writer", daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        # Feedback whose record is not in the DB yet: (next check, give up at, operation)
+        waiting: Deque[Tuple[float, float, Dict]] = deque()
+        while True:
+            while waiting and waiting[0][0] <= time.monotonic():
+                _, give_up_at, operation = waiting.popleft()
+                self._write_feedback(operation, give_up_at, waiting)
+            try:
+                item = self._queue.get(timeout=max(0.0, waiting[0][0] - time.monotonic()) if waiting else None)
+            except queue.Empty:
+                continue
+            if item is None:
+                # Feedback still waiting for its record stays in the journal for the next startup
+                for _ in range(len(waiting) + 1):
+                    self._queue.task_done()
+                break
+            operation, image = item
+            if operation["op"] == "feedback":
+                give_up_at = time.monotonic() + self.feedback_wait
+                if any(other["record_id"] == operation["record_id"] for _, _, other in waiting):
+                    # Behind earlier feedback for the same record, so the newest correction wins
+                    waiting.append((time.monotonic() + _FEEDBACK_RETRY, give_up_at, operation))
+                else:
+                    self._write_feedback(operation, give_up_at, waiting)
+                continue
+            try:
+                self._write(operation, image)
+            finally:
+                self._queue.task_done()
+
+    def _write_feedback(self, operation: Dict, give_up_at: float, waiting: Deque):
+        """
+        Write feedback once its record exists
+
+        This process's own inserts are ahead of it in the queue, but under
+        several workers the visitor's photo may have been classified by
+        another one whose writer has not caught up: hold the feedback back
+        (without blocking the queue) rather than fail it.
+        """
+        if self.db.get_prediction(operation["record_id"]) is None and time.monotonic() < give_up_at:
+            waiting.append((time.monotonic() + _FEEDBACK_RETRY, give_up_at, operation))
+            return
+        try:
+            self._write(operation, None)
+        finally:
+            self._queue.task_done()
+
+    def _write(self, operation: Dict, image: Optional[Image.Image]) -> bool:
+        """Apply a journaled operation with retries; False if it stays in the journal"""
+        for attempt in range(_WRITE_ATTEMPTS):
+            try:
+                self._apply(operation, image)
+            except Exception as e:
+                if attempt + 1 == _WRITE_ATTEMPTS:
+                    # Leave the entry in the journal so it is replayed on restart
+                    print(f"Error persisting {operation['record_id']}: {e}")
+                    return False
+                time.sleep(0.5 * 2 ** attempt)
+            else:
+                self._journal_done(operation)
+                return True
+        return False
+
+    def _apply(self, operation: Dict, image: Optional[Image.Image]):
+        """Write one operation; raises if it did not reach the database"""
+        with metrics.stage("persist"):
+            if operation["op"] == "prediction":
+                if image is not None:
+                    image_path = self.images.put(image)
+                else:
+                    # Replayed from the journal: the pixels did not survive the crash
+                    # (entries from before the image store still name their file)
+                    image_path = operation.get("image_path")
+                    if image_path and not Path(image_path).exists():
+                        image_path = None
+                saved = self.db.save_prediction(
+                    record_id=operation["record_id"],
+                    image_path=image_path,
+                    overlay_path=image_path,
+                    predictions=operation["predictions"],
+                    timestamp=operation["timestamp"]
+                )
+                # A replayed insert may have landed before the crash: that counts as written
+                if not saved and self.db.get_prediction(operation["record_id"]) is None:
+                    raise RuntimeError("prediction was not saved")
+                if image is not None:
+                    # Another worker may have evicted a shared file before the insert
+                    self.images.ensure(image_path, image, operation["record_id"])
+                if self.images.over_budget:
+                    # After the insert, so an image this record shares counts as new
+                    self.images.enforce_budget()
+                if operation.get("embedding") and self.embeddings is not None:
+                    embedding = np.frombuffer(base64.b64decode(operation["embedding"]), dtype=np.float16)
+                    try:
+                        self.embeddings.put(operation["record_id"], embedding)
+                    except ValueError as e:
+                        # Store built with another model: the record itself is saved
+                        print(f"Not storing embedding for {operation['record_id']}: {e}")
+            elif operation["op"] == "feedback":
+                if not self.db.save_feedback(
+                    operation["record_id"], operation["user_correction"], timestamp=operation["timestamp"]
+                ):
+                    raise RuntimeError("feedback was not saved (no such record)")
+
+    # Journal -------------------------------------------------------------
+
+    def _journal_path(self, pid: Optional[int] = None) -> Path:
+        return self.journal_dir / f"writer-{pid or os.getpid()}.jsonl"
+
+    def _journal_write(self, entry: Dict):
+        if self._journal_file is None:
+            self._journal_file = open(self._journal_path(), "a")
+        self._journal_file.write(json.dumps(entry) + "\n")
+        self._journal_file.flush()
+        os.fsync(self._journal_file.fileno())
+
+    def _journal_append(self, operation: Dict):
+        # One record can have several operations in flight (e.g. repeated feedback),
+        # so completion markers name the exact entry
+        operation["seq"] = uuid.uuid4().hex
+        with self._journal_lock:
+            self._journal_write(operation)
+            self._journal_pending += 1
+
+    def _journal_done(self, operation: Dict):
+        with self._journal_lock:
+            self._journal_pending -= 1
+            if self._journal_pending == 0:
+                # Everything journaled so far is on disk: start a fresh journal
+                self._journal_file.seek(0)
+                self._journal_file.truncate()
+            else:
+                self._journal_write({"op": "done", "seq": operation["seq"]})
+
+    def recover(self) -> int:
+        """
+        Replay operations left unfinished by a previous run
+
+        Journals of other processes that are still alive are left alone.
+
+        Returns:
+            Number of operations replayed
+        """
+        replayed = 0
+        for path in sorted(self.journal_dir.glob("writer-*.jsonl")):
+            try:
+                pid = int(path.stem.split("-", 1)[1])
+            except ValueError:
+                continue
+            if pid == os.getpid() and self._journal_file is not None:
+                continue
+            if pid != os.getpid() and _process_alive(pid):
+                continue
+
+            pending: Dict = {}
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # torn final line from the crash
+                    if entry["op"] == "done":
+                        pending.pop(_journal_key(entry, entry.get("of")), None)
+                    else:
+                        pending[_journal_key(entry, entry["op"])] = entry
+            failed = []
+            for operation in pending.values():
+                try:
+                    self._apply(operation, None)
+                    replayed += 1
+                except Exception as e:
+                    print(f"Could not replay {operation['record_id']}: {e}")
+                    failed.append(operation)
+            if failed:
+                # Keep only what is still unwritten, for the next startup to retry
+                tmp_path = path.with_suffix(f".tmp{os.getpid()}")
+                with open(tmp_path, "w") as f:
+                    f.writelines(json.dumps(operation) + "\n" for operation in failed)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, path)
+            else:
+                path.unlink()
+        if replayed:
+            print(f"Recovered {replayed} queued writes from the journal")
+        return replayed
+
+
+def _journal_key(entry: Dict, op: Optional[str]):
+    # Journals written before entries had a seq matched markers by record and op
+    return entry["seq"] if "seq" in entry else (entry["record_id"], op)
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
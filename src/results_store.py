@@ -0,0 +1,181 @@
+"""
+Results store for Fashion Police
+Keeps each visitor's result between /process_image and /results + /feedback
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from . import config
+
+
+_RECORD_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+class ResultsStore:
+    """Bounded in-memory results cache with an on-disk spill tier
+
+    Entries live in an LRU dict capped by a byte budget and a TTL. Evicted
+    entries spill to disk (result JSON + display overlay, never the original
+    photo), and anything that is neither in memory nor spilled - e.g. a
+    result produced by another worker process - is rebuilt through the
+    `loader` callback from FashionDB and the saved anonymized overlay.
+    """
+
+    def __init__(
+        self,
+        spill_dir: Path = config.RESULTS_SPILL_DIR,
+        max_bytes: int = config.RESULTS_MAX_BYTES,
+        ttl_seconds: float = config.RESULTS_TTL_SECONDS,
+        loader: Optional[Callable[[str], Optional[Dict]]] = None,
+        write_through: bool = config.RESULTS_WRITE_THROUGH,
+    ):
+        """
+        Args:
+            spill_dir: Directory for evicted entries (shared by all workers)
+            max_bytes: Memory budget for cached photos and overlays
+            ttl_seconds: How long a result stays available in memory and on disk
+            loader: Fallback that rebuilds an entry for a record_id, or returns None
+            write_through: Also write every new entry to the spill directory, so
+                other worker processes can serve it straight away
+        """
+        self.spill_dir = Path(spill_dir)
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.loader = loader
+        self.write_through = write_through
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+
+    @staticmethod
+    def _entry_size(entry: Dict) -> int:
+        return len(entry.get("image") or b"") + len(entry.get("overlay") or b"")
+
+    def put(self, record_id: str, result: Dict, image: Optional[bytes], overlay: bytes):
+        """
+        Cache a result
+
+        Args:
+            record_id: Record the result belongs to
+            result: JSON-serialisable result structure
+            image: Original photo as encoded bytes (kept in memory only)
+            overlay: Display overlay as encoded JPEG bytes
+        """
+        entry = {"result": result, "image": image, "overlay": overlay, "created": time.time()}
+        with self._lock:
+            self._remove(record_id)
+            self._entries[record_id] = entry
+            self._bytes += self._entry_size(entry)
+            evicted = self._evict()
+        if self.write_through:
+            # Already on disk: evicted entries need no second write
+            self._spill(record_id, entry)
+            return
+        for evicted_id, evicted_entry in evicted:
+            self._spill(evicted_id, evicted_entry)
+
+    def get(self, record_id: str) -> Optional[Dict]:
+        """
+        Look up a result in memory, then on disk, then through the loader
+
+        Returns:
+            Dict with 'result', 'image' (None once the original is gone) and
+            'overlay', or None if the result is unknown or expired
+        """
+        if not record_id or not _RECORD_ID_PATTERN.match(record_id):
+            return None
+        with self._lock:
+            entry = self._entries.get(record_id)
+            if entry is not None:
+                if time.time() - entry["created"] <= self.ttl_seconds:
+                    self._entries.move_to_end(record_id)
+                    return entry
+                self._remove(record_id)
+
+        entry = self._load_spilled(record_id)
+        if entry is None and self.loader is not None:
+            entry = self.loader(record_id)
+        return entry
+
+    def __contains__(self, record_id: str) -> bool:
+        return self.get(record_id) is not None
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, record_id: str):
+        entry = self._entries.pop(record_id, None)
+        if entry is not None:
+            self._bytes -= self._entry_size(entry)
+
+    def _evict(self):
+        """Pop expired entries, then least recently used ones until within budget (lock held)"""
+        evicted = []
+        now = time.time()
+        for record_id in list(self._entries):
+            if now - self._entries[record_id]["created"] > self.ttl_seconds:
+                self._remove(record_id)
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            record_id, entry = self._entries.popitem(last=False)
+            self._bytes -= self._entry_size(entry)
+            evicted.append((record_id, entry))
+        return evicted
+
+    def _spill_paths(self, record_id: str):
+        return self.spill_dir / f"{record_id}.json", self.spill_dir / f"{record_id}.jpg"
+
+    def _spill(self, record_id: str, entry: Dict):
+        """Write an evicted entry to disk (the original photo is dropped)"""
+        result_path, overlay_path = self._spill_paths(record_id)
+        try:
+            tmp_overlay = overlay_path.with_suffix(f".tmp{os.getpid()}")
+            tmp_overlay.write_bytes(entry["overlay"])
+            os.replace(tmp_overlay, overlay_path)
+            tmp_result = result_path.with_suffix(f".tmp{os.getpid()}")
+            tmp_result.write_text(json.dumps({"result": entry["result"], "created": entry["created"]}))
+            os.replace(tmp_result, result_path)
+        except OSError as e:
+            print(f"Could not spill result {record_id}: {e}")
+        self._prune_spilled()
+
+    def _load_spilled(self, record_id: str) -> Optional[Dict]:
+        result_path, overlay_path = self._spill_paths(record_id)
+        try:
+            spilled = json.loads(result_path.read_text())
+            if time.time() - spilled["created"] > self.ttl_seconds:
+                return None
+            return {
+                "result": spilled["result"],
+                "image": None,
+                "overlay": overlay_path.read_bytes(),
+                "created": spilled["created"],
+            }
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _prune_spilled(self):
+        """Delete spilled entries older than the TTL (at most once a minute)"""
+        now = time.time()
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        cutoff = now - self.ttl_seconds
+        for path in self.spill_dir.iterdir():
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                pass
@@ -0,0 +1,114 @@
+"""
+backends.py
+-----------
+
+Optimized CPU inference backends for the two models.
+
+* ``eager``       - plain fp32 PyTorch (reference)
+* ``int8``        - dynamically int8-quantized ``nn.Linear`` layers, which hold
+                    nearly all of the weights and FLOPs in both transformers
+* ``torchscript`` - traced and frozen fp32 graph
+
+Converted models are saved as TorchScript archives under
+``config.BACKEND_CACHE_DIR`` so conversion only runs once per model, backend,
+input shape and torch version.
+
+Usage
+-----
+>>> forward = load_backend(SegmentationLogits(model), "int8", (torch.zeros(1, 3, 512, 512),), "segformer")
+>>> logits = forward(pixel_values)
+"""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Callable, Tuple
+
+import torch
+
+from .. import config
+
+BACKENDS = ("eager", "int8", "torchscript")
+
+
+class SegmentationLogits(torch.nn.Module):
+    """Traceable wrapper: pixel_values -> segmentation logits."""
+
+    def __init__(self, model: torch.nn.Module) -> None:
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return self.model(pixel_values=pixel_values).logits
+
+
+class ClipImageFeatures(torch.nn.Module):
+    """Traceable wrapper: pixel_values -> (unnormalized) CLIP image embeddings."""
+
+    def __init__(self, model: torch.nn.Module) -> None:
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return self.model.get_image_features(pixel_values=pixel_values)
+
+
+def _cache_path(name: str, backend: str, example_inputs: Tuple[torch.Tensor, ...], cache_dir: Path) -> Path:
+    shape = "x".join(str(dim) for dim in example_inputs[0].shape[1:])
+    slug = name.replace("/", "--")
+    return Path(cache_dir) / f"{slug}-{backend}-{shape}-torch{torch.__version__}.pt"
+
+
+def _convert(module: torch.nn.Module, backend: str, example_inputs: Tuple[torch.Tensor, ...]) -> torch.jit.ScriptModule:
+    module = module.eval()
+    if backend == "int8":
+        module = torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+    with torch.no_grad():
+        traced = torch.jit.trace(module, example_inputs, check_trace=False)
+    return torch.jit.freeze(traced.eval())
+
+
+def load_backend(
+    module: torch.nn.Module,
+    backend: str,
+    example_inputs: Tuple[torch.Tensor, ...],
+    name: str,
+    cache_dir: str | Path = config.BACKEND_CACHE_DIR,
+) -> Callable[..., torch.Tensor]:
+    """
+    Return a forward callable for `module` running on the requested backend.
+
+    Parameters
+    ----------
+    module : torch.nn.Module
+        Eager fp32 module (e.g. `SegmentationLogits(model)`).
+    backend : str
+        One of `BACKENDS`.
+    example_inputs : tuple of torch.Tensor
+        Inputs used to trace the graph; the batch dimension stays dynamic.
+    name : str
+        Model identifier, used to key the on-disk cache.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+    if backend == "eager":
+        return module.eval()
+
+    path = _cache_path(name, backend, example_inputs, Path(cache_dir))
+    if path.exists():
+        try:
+            return torch.jit.load(str(path), map_location="cpu").eval()
+        except Exception as e:
+            print(f"Ignoring unreadable backend cache {path}: {e}")
+
+    print(f"Converting {name} to the {backend} backend (runs once)...")
+    converted = _convert(module, backend, example_inputs)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".tmp{os.getpid()}")
+        torch.jit.save(converted, str(tmp_path))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Could not cache {backend} backend at {path}: {e}")
+    return converted
@@ -0,0 +1,285 @@
+"""
+batch_classify.py
+-----------------
+
+Offline (re)classification of many images at once.
+
+Two sources are supported:
+
+* ``--db``  re-scores every record in FashionDB (e.g. after editing
+            ``STYLES``) and updates the stored predictions in bulk. Records
+            whose CLIP embedding is in the EmbeddingStore are re-scored
+            straight from it, one matrix multiply per chunk; only the rest
+            (or everything, with ``--reembed``) run CLIP on the anonymized
+            overlay, and their embeddings are stored. The statistics
+            triggers keep the stats page consistent.
+* ``--dir`` classifies every image in a folder and appends one JSON line
+            per image to ``--output``.
+
+Images are decoded and downscaled in a pool of worker processes with a
+bounded prefetch window, while the main process runs batched inference.
+By default only the style predictor runs, because the stored overlays
+already are the segmentation result. ``--segment`` runs the full
+`OutfitClassifier` and writes anonymized overlays to ``--overlay-dir``.
+
+Progress is checkpointed after every committed batch, so an interrupted
+run resumes where it stopped. Re-running with a different style set or
+model starts over.
+
+Usage
+-----
+    python -m src.scripts.batch_classify --db data/predictions.db
+    python -m src.scripts.batch_classify --db data/predictions.db --reembed
+    python -m src.scripts.batch_classify --dir photos/ --output photos.jsonl --batch-size 16
+    python -m src.scripts.batch_classify --dir photos/ --output photos.jsonl --segment --overlay-dir overlays/
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Deque, Dict, Iterator, List, Set, Tuple
+
+import torch
+
+from .. import config
+from ..database import FashionDB
+from ..embedding_store import EmbeddingStore
+from .backends import BACKENDS
+from .check_backends import list_images
+from .classify_outfit import OutfitClassifier
+from .preprocess import PreparedImage, load_image
+from .snapshots import model_id
+from .style_predictor import StylePredictor
+
+
+def checkpoint_fingerprint(source: str, segment: bool) -> str:
+    """Identifies what a checkpoint was computed with; a change forces a fresh run"""
+    return json.dumps([source, StylePredictor._text_key, config.SEG_MODEL_NAME if segment else None])
+
+
+def load_checkpoint(path: Path, fingerprint: str) -> Dict:
+    try:
+        checkpoint = json.loads(path.read_text())
+        if checkpoint.get("fingerprint") == fingerprint:
+            return checkpoint
+        print(f"Ignoring checkpoint {path}: it was made with a different source, style set or model")
+    except (OSError, ValueError):
+        pass
+    return {"fingerprint": fingerprint, "last_key": "", "done": 0, "failed": 0}
+
+
+def save_checkpoint(path: Path, checkpoint: Dict) -> None:
+    tmp_path = path.with_suffix(f".tmp{os.getpid()}")
+    tmp_path.write_text(json.dumps(checkpoint))
+    os.replace(tmp_path, path)
+
+
+def prefetch(
+    items: List[Tuple[str, str]], pool: ProcessPoolExecutor, window: int, max_side: int
+) -> Iterator[Tuple[str, PreparedImage | Exception]]:
+    """Decode (key, path) items in the pool, keeping at most `window` in flight, in order"""
+    pending: Deque[Tuple[str, Future]] = deque()
+    remaining = iter(items)
+    for key, path in remaining:
+        pending.append((key, pool.submit(load_image, path, max_side)))
+        if len(pending) >= window:
+            break
+    while pending:
+        key, future = pending.popleft()
+        next_item = next(remaining, None)
+        if next_item is not None:
+            pending.append((next_item[0], pool.submit(load_image, next_item[1], max_side)))
+        try:
+            yield key, future.result()
+        except Exception as e:
+            yield key, e
+
+
+def batches(stream: Iterator, batch_size: int) -> Iterator[List]:
+    batch = []
+    for item in stream:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def open_embedding_store(args: argparse.Namespace) -> EmbeddingStore:
+    """The DB's EmbeddingStore, emptied first when it holds another model's embeddings and --reembed is set"""
+    directory = args.embeddings or Path(args.db).parent / "embeddings"
+    store = EmbeddingStore(directory, model_id=model_id(config.CLIP_MODEL_NAME, config.CLIP_MODEL_REVISION))
+    if store.model and store.model != store.model_id:
+        if not args.reembed:
+            raise SystemExit(
+                f"{directory} holds {store.model} embeddings but the current CLIP model is {store.model_id}; "
+                f"re-run with --reembed to replace them"
+            )
+        print(f"Dropping {len(store)} {store.model} embeddings")
+        store.clear()
+    return store
+
+
+def rescore_stored(
+    db: FashionDB, store: EmbeddingStore, style_predictor: StylePredictor, record_ids: List[str]
+) -> Set[str]:
+    """Re-score the records that already have an embedding; returns their ids"""
+    rescored = set()
+    for chunk_ids, embeds in store.iter_chunks(record_ids):
+        predictions = style_predictor.predictions_from_embeddings(torch.from_numpy(embeds))
+        db.update_predictions(list(zip(chunk_ids, predictions)))
+        rescored.update(chunk_ids)
+    return rescored
+
+
+def run(args: argparse.Namespace) -> Dict:
+    # Start the decode workers before any model is loaded or torch op has run:
+    # they only use PIL, and forking after torch has started its thread pool
+    # is not safe
+    pool = ProcessPoolExecutor(max_workers=args.workers)
+    pool.submit(os.getpid).result()
+
+    style_predictor = StylePredictor(backend=args.clip_backend)
+    classifier = OutfitClassifier(style_predictor=style_predictor) if args.segment else None
+
+    db = FashionDB(args.db) if args.db else None
+    source = f"db:{Path(args.db).resolve()}" if db else f"dir:{args.dir.resolve()}"
+    checkpoint_path = args.checkpoint or Path(
+        str(args.db) + ".batch-checkpoint.json" if db else str(args.output) + ".checkpoint.json"
+    )
+    checkpoint = load_checkpoint(checkpoint_path, checkpoint_fingerprint(source, args.segment))
+    if checkpoint["done"]:
+        print(f"Resuming after {checkpoint['done']} images (last: {checkpoint['last_key']})")
+
+    if db:
+        items = db.get_image_paths(after=checkpoint["last_key"])
+    else:
+        paths = list_images(args.dir)
+        items = [(str(path.relative_to(args.dir)), str(path)) for path in paths]
+        items = [item for item in items if item[0] > checkpoint["last_key"]]
+    if args.limit:
+        items = items[:args.limit]
+
+    store = open_embedding_store(args) if db else None
+    start = time.perf_counter()
+    rescored = 0
+    if store is not None and not args.reembed and not args.segment:
+        # Cheap and idempotent, so not checkpointed: only CLIP runs are.
+        # Covers records whose full-size image was evicted from the image store
+        stored = rescore_stored(db, store, style_predictor, db.get_record_ids(after=checkpoint["last_key"]))
+        rescored = len(stored)
+        items = [item for item in items if item[0] not in stored]
+        print(f"Re-scored {rescored} records from stored embeddings in {time.perf_counter() - start:.1f}s")
+
+    if args.overlay_dir:
+        args.overlay_dir.mkdir(parents=True, exist_ok=True)
+    print(f"{len(items)} images to classify with {args.workers} decode workers, batch size {args.batch_size}")
+
+    output = open(args.output, "a") if args.output else None
+    processed = failed = 0
+    try:
+        window = max(args.batch_size, args.prefetch)
+        for batch in batches(prefetch(items, pool, window, args.max_side), args.batch_size):
+            good = [(key, image) for key, image in batch if isinstance(image, PreparedImage)]
+            for key, error in batch:
+                if not isinstance(error, PreparedImage):
+                    print(f"Skipping {key}: {error}")
+            failed += len(batch) - len(good)
+
+            keys = [key for key, _ in good]
+            if not good:
+                predictions, embeddings = [], []
+            elif classifier is not None:
+                outputs = classifier.classify_batch([image for _, image in good])
+                predictions = [result[0] for result in outputs]
+                embeddings = [result[3] for result in outputs]
+                if args.overlay_dir:
+                    for key, (_, _, anonymized_overlay, _) in zip(keys, outputs):
+                        name = Path(key).stem + "_anonymized.jpg"
+                        anonymized_overlay.save(args.overlay_dir / name, format="JPEG", quality=95)
+            else:
+                image_embeds = style_predictor.embed_images([image.crop for _, image in good])
+                predictions = style_predictor.predictions_from_embeddings(image_embeds)
+                embeddings = list(image_embeds.cpu().numpy())
+
+            if db:
+                db.update_predictions(list(zip(keys, predictions)))
+                store.put_many(zip(keys, embeddings))
+            else:
+                for key, image_predictions in zip(keys, predictions):
+                    output.write(json.dumps({"path": key, "predictions": image_predictions}) + "\n")
+                output.flush()
+
+            processed += len(good)
+            checkpoint["last_key"] = batch[-1][0]
+            checkpoint["done"] += len(good)
+            checkpoint["failed"] += len(batch) - len(good)
+            save_checkpoint(checkpoint_path, checkpoint)
+
+            elapsed = time.perf_counter() - start
+            print(f"  {processed + failed}/{len(items)} images, {processed / elapsed:.1f} images/s", end="\r")
+    finally:
+        pool.shutdown(cancel_futures=True)
+        if output:
+            output.close()
+        if classifier is not None:
+            classifier.close()
+
+    elapsed = time.perf_counter() - start
+    print()
+    return {
+        "processed": processed,
+        "rescored": rescored,
+        "failed": failed,
+        "seconds": elapsed,
+        "images_per_second": processed / elapsed if elapsed > 0 else 0.0,
+        "checkpoint": str(checkpoint_path),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Classify a folder or re-score the prediction history")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--db", type=Path, help="Re-score every record in this FashionDB and update it")
+    source.add_argument("--dir", type=Path, help="Classify every image in this folder")
+    parser.add_argument("--output", type=Path, default=None, help="JSONL results file (required with --dir)")
+    parser.add_argument("--segment", action="store_true", help="Also run segmentation (full OutfitClassifier)")
+    parser.add_argument("--overlay-dir", type=Path, default=None, help="Save anonymized overlays here (with --segment)")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=max(1, min(4, (os.cpu_count() or 2) // 2)),
+                        help="Decode worker processes")
+    parser.add_argument("--prefetch", type=int, default=32, help="Images decoded ahead of inference")
+    parser.add_argument("--max-side", type=int, default=config.MAX_IMAGE_SIDE)
+    parser.add_argument("--clip-backend", choices=BACKENDS, default=config.CLIP_BACKEND)
+    parser.add_argument("--limit", type=int, default=None, help="Stop after N images")
+    parser.add_argument("--checkpoint", type=Path, default=None, help="Checkpoint file (default: next to the output)")
+    parser.add_argument("--embeddings", type=Path, default=None,
+                        help="EmbeddingStore directory (with --db; default: embeddings/ next to the DB)")
+    parser.add_argument("--reembed", action="store_true",
+                        help="Run CLIP on every record even when its embedding is stored (with --db)")
+    args = parser.parse_args()
+
+    if args.dir and not args.output:
+        parser.error("--dir needs --output")
+    if args.overlay_dir and not args.segment:
+        parser.error("--overlay-dir needs --segment")
+    if (args.embeddings or args.reembed) and not args.db:
+        parser.error("--embeddings and --reembed need --db")
+
+    report = run(args)
+    print(
+        f"Classified {report['processed']} images ({report['failed']} failed) in {report['seconds']:.1f}s: "
+        f"{report['images_per_second']:.1f} images/s"
+        + (f", {report['rescored']} re-scored from stored embeddings" if report['rescored'] else "")
+    )
+
+
+if __name__ == "__main__":
+    main()
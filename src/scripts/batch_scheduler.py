@@ -0,0 +1,138 @@
+"""
+batch_scheduler.py
+------------------
+
+Micro-batching scheduler that sits in front of `OutfitClassifier`.
+
+Concurrent callers submit single images; a worker thread collects whatever
+arrives within a short batching window (up to `max_batch_size` images) and
+runs them through both models as one batched forward pass. Each caller gets
+back a `Future` resolving to its own `(predictions, display_overlay,
+anonymized_overlay, embedding)` tuple.
+
+Usage
+-----
+>>> scheduler = BatchScheduler(classifier, max_batch_size=4, max_wait_ms=10)
+>>> predictions, display_overlay, anonymized_overlay, embedding = scheduler.submit(image).result()
+"""
+
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Tuple
+
+from PIL import Image
+
+from .. import config, metrics
+from .classify_outfit import OutfitClassifier
+from .preprocess import PreparedImage
+
+
+class BatchScheduler:
+    """Collects concurrent classification requests into batched forward passes."""
+
+    def __init__(
+        self,
+        classifier: OutfitClassifier,
+        max_batch_size: int = config.BATCH_MAX_SIZE,
+        max_wait_ms: float = config.BATCH_MAX_WAIT_MS,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        classifier : OutfitClassifier
+            The pipeline that runs each batch (anything with `classify_batch`,
+            e.g. the app's `ModelLoader`).
+        max_batch_size : int
+            Maximum number of images per forward pass.
+        max_wait_ms : float
+            How long to wait for more requests after the first one arrives.
+        """
+        self.classifier = classifier
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: queue.Queue[Tuple[Image.Image | PreparedImage, Future, float, bool]] = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: threading.Thread | None = None
+        self._worker_pid: int | None = None
+
+    def submit(self, image: Image.Image | PreparedImage, degraded: bool = False) -> Future:
+        """
+        Queue an image for classification and return a Future for its result.
+
+        Images queued with `degraded=True` run through the classifier's
+        cheaper pipeline, in a batch of their own.
+        """
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((image, future, time.perf_counter(), degraded))
+        return future
+
+    def classify(self, image: Image.Image | PreparedImage, degraded: bool = False):
+        """Blocking convenience wrapper around `submit`."""
+        return self.submit(image, degraded).result()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def _ensure_worker(self) -> None:
+        # Threads do not survive fork(), so (re)start the worker lazily in
+        # whichever process is actually serving requests.
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+                return
+            if self._worker_pid != os.getpid():
+                self._queue = queue.Queue()
+            self._worker_pid = os.getpid()
+            self._worker = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+            self._worker.start()
+
+    def _collect_batch(self) -> List[Tuple[Image.Image | PreparedImage, Future, float, bool]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            # Skip callers that gave up while waiting in the queue
+            batch = [item for item in self._collect_batch() if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            for _, _, queued_at, _ in batch:
+                metrics.STAGE_SECONDS.observe(started - queued_at, stage="queue_wait")
+            # Full and degraded pipeline requests (around a mode switch) run separately
+            for degraded in (False, True):
+                group = [(image, future) for image, future, _, flag in batch if flag == degraded]
+                if group:
+                    self._run_batch(group, degraded)
+
+    def _run_batch(self, batch: List[Tuple[Image.Image | PreparedImage, Future]], degraded: bool) -> None:
+        try:
+            # Only pass the option when set, so any plain `classify_batch(images)` still works
+            if degraded:
+                results = self.classifier.classify_batch([image for image, _ in batch], degraded=True)
+            else:
+                results = self.classifier.classify_batch([image for image, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
@@ -0,0 +1,369 @@
+"""
+benchmark.py
+------------
+
+Offline, reproducible benchmark for the classify pipeline and the
+/process_image request path.
+
+Each iteration times the individual stages (decode, segmentation forward,
+logits upsample, overlay composition, CLIP image embed, text embed, JPEG
+encode, DB write), one end-to-end pass through `OutfitClassifier`, and one
+POST to /process_image through the Flask test client (the app's own
+decode, frame-cache, scheduler and persistence path, with the same models).
+Latency percentiles, the largest growth of current RSS within each stage
+and the process-wide peak RSS are written as JSON so two runs (e.g. before
+and after a torch upgrade) can be diffed with ``--baseline``.
+
+It runs either with the real models from the local Hugging Face cache
+(set ``HF_HUB_OFFLINE=1`` to forbid downloads) or with tiny randomly
+initialised stand-ins of the same architectures, which needs no network.
+
+Usage
+-----
+    python -m src.scripts.benchmark --models stand-in --iterations 20 --output bench.json
+    python -m src.scripts.benchmark --models real --seg-backend int8 --baseline bench.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib
+import io
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+import torch
+import transformers
+from PIL import Image
+
+from .. import config
+from ..data.styles import STYLES
+from ..database import FashionDB
+from .backends import BACKENDS, ClipImageFeatures, SegmentationLogits, load_backend
+from .check_backends import list_images
+from .classify_outfit import OutfitClassifier
+from .load_model import SegmentationModel
+from .preprocess import prepare_image
+from .style_predictor import StylePredictor
+
+STAGES = (
+    "decode",
+    "seg_forward",
+    "logits_upsample",
+    "overlay_compose",
+    "clip_image_embed",
+    "text_embed",
+    "jpeg_encode",
+    "db_write",
+    "end_to_end",
+    "process_image",
+)
+
+STAND_IN_SEG_NAME = "stand-in/segformer-tiny"
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def current_rss_mb() -> float | None:
+    """Current resident set size of this process (None where /proc is not available)"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+class StageTimer:
+    """
+    Collects per-stage latencies and how much current RSS grew during each stage.
+
+    The peak RSS only ever rises, so after the first large stage it says
+    nothing about the later ones; the growth of current RSS does.
+    """
+
+    def __init__(self) -> None:
+        self.samples: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+        self.rss_growth: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+
+    @contextmanager
+    def stage(self, name: str):
+        rss_before = current_rss_mb()
+        start = time.perf_counter()
+        yield
+        self.samples[name].append((time.perf_counter() - start) * 1000)
+        rss_after = current_rss_mb()
+        if rss_before is not None and rss_after is not None:
+            self.rss_growth[name].append(rss_after - rss_before)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        report = {}
+        for name, samples in self.samples.items():
+            if not samples:
+                continue
+            values = np.array(samples)
+            report[name] = {
+                "count": len(samples),
+                "mean_ms": float(values.mean()),
+                "p50_ms": float(np.percentile(values, 50)),
+                "p95_ms": float(np.percentile(values, 95)),
+                "p99_ms": float(np.percentile(values, 99)),
+                "max_ms": float(values.max()),
+                "rss_growth_mb": max(self.rss_growth[name]) if self.rss_growth[name] else None,
+            }
+        return report
+
+
+def _stand_in_tokenizer(directory: Path) -> transformers.CLIPTokenizer:
+    """Character-level CLIP tokenizer that needs no downloaded vocabulary"""
+    from transformers.models.clip.tokenization_clip import bytes_to_unicode
+
+    chars = list(bytes_to_unicode().values())
+    vocab = {char: i for i, char in enumerate(chars)}
+    for char in chars:
+        vocab[char + "</w>"] = len(vocab)
+    for token in ("<|startoftext|>", "<|endoftext|>"):
+        vocab[token] = len(vocab)
+    (directory / "vocab.json").write_text(json.dumps(vocab))
+    (directory / "merges.txt").write_text("#version: 0.2\n")
+    return transformers.CLIPTokenizer(str(directory / "vocab.json"), str(directory / "merges.txt"))
+
+
+def build_stand_in_models(seg_backend: str, clip_backend: str, work_dir: Path) -> Tuple[SegmentationModel, StylePredictor]:
+    """
+    Tiny randomly-initialised SegFormer and CLIP models with the real
+    architectures and pre-processing, registered under stand-in names so
+    they never touch the real model caches.
+    """
+    torch.manual_seed(0)
+    seg_config = transformers.SegformerConfig(
+        num_labels=len(SegmentationModel.id2label),
+        hidden_sizes=[16, 32, 64, 128],
+        num_attention_heads=[1, 2, 4, 8],
+        depths=[1, 1, 1, 1],
+        decoder_hidden_size=64,
+    )
+    seg_model = transformers.SegformerForSemanticSegmentation(seg_config).eval()
+    seg_processor = transformers.SegformerImageProcessor()
+    example = torch.zeros(1, 3, seg_processor.size["height"], seg_processor.size["width"])
+    SegmentationModel._loaded[(STAND_IN_SEG_NAME, seg_backend)] = (
+        seg_processor,
+        load_backend(SegmentationLogits(seg_model), seg_backend, (example,), STAND_IN_SEG_NAME, cache_dir=work_dir),
+    )
+
+    tokenizer = _stand_in_tokenizer(work_dir)
+    clip_config = transformers.CLIPConfig(
+        text_config=dict(
+            vocab_size=len(tokenizer), hidden_size=64, intermediate_size=128,
+            num_hidden_layers=2, num_attention_heads=2, max_position_embeddings=77,
+        ),
+        vision_config=dict(
+            hidden_size=64, intermediate_size=128, num_hidden_layers=2,
+            num_attention_heads=2, image_size=224, patch_size=32,
+        ),
+        projection_dim=32,
+    )
+    clip_model = transformers.CLIPModel(clip_config).eval()
+    StylePredictor._model = clip_model
+    StylePredictor._processor = transformers.CLIPProcessor(
+        image_processor=transformers.CLIPImageProcessor(), tokenizer=tokenizer
+    )
+    example = torch.zeros(1, 3, 224, 224)
+    StylePredictor._image_fns = {
+        clip_backend: load_backend(ClipImageFeatures(clip_model), clip_backend, (example,), "stand-in/clip-tiny", cache_dir=work_dir)
+    }
+    StylePredictor._text_key = None
+
+    return (
+        SegmentationModel(model_name=STAND_IN_SEG_NAME, backend=seg_backend, revision=""),
+        StylePredictor(cache_dir=work_dir, backend=clip_backend),
+    )
+
+
+def synthetic_images(count: int, size: Tuple[int, int], seed: int = 0) -> List[bytes]:
+    """
+    Deterministic JPEG frames: smooth gradients plus noise, roughly camera-like to encode.
+    A coarse random block pattern per frame keeps them perceptually distinct, so the
+    frame cache does not treat them as retakes of each other.
+    """
+    rng = np.random.default_rng(seed)
+    width, height = size
+    images = []
+    for _ in range(count):
+        gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+        base = np.broadcast_to(gradient, (height, width, 3)) * rng.uniform(0.3, 1.0, size=3)
+        blocks = Image.fromarray(rng.uniform(0, 255, size=(6, 8)).astype(np.uint8)).resize((width, height))
+        base = base * 0.5 + np.asarray(blocks, dtype=np.float32)[:, :, None] * 0.5
+        noisy = base + rng.normal(0, 12, size=(height, width, 3))
+        buffer = io.BytesIO()
+        Image.fromarray(np.clip(noisy, 0, 255).astype(np.uint8)).save(buffer, format="JPEG", quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+def run(args: argparse.Namespace) -> Dict:
+    torch.set_num_threads(args.threads or torch.get_num_threads())
+    # Stand-in models, converted backends and the scratch DB are removed afterwards
+    with tempfile.TemporaryDirectory(prefix="fashion-bench-") as work_dir:
+        return _run(args, Path(work_dir))
+
+
+def _run(args: argparse.Namespace, work_dir: Path) -> Dict:
+    if args.models == "stand-in":
+        seg_model, style_predictor = build_stand_in_models(args.seg_backend, args.clip_backend, work_dir)
+    else:
+        seg_model = SegmentationModel(backend=args.seg_backend)
+        style_predictor = StylePredictor(backend=args.clip_backend)
+    seg_model.upsample = args.upsample
+    classifier = OutfitClassifier(
+        concurrent=args.concurrent, seg_model=seg_model, style_predictor=style_predictor
+    )
+    db = FashionDB(str(work_dir / "bench.db"))
+    client = _app_client(classifier, work_dir / "app")
+
+    if args.images:
+        frames = [path.read_bytes() for path in list_images(args.images, args.iterations)]
+    else:
+        frames = synthetic_images(min(args.iterations, 8), (args.width, args.height))
+    prompts = [STYLES[name]["description"] for name in STYLES]
+
+    timer = StageTimer()
+    for iteration in range(args.warmup + args.iterations):
+        if iteration == args.warmup:
+            timer = StageTimer()  # discard warm-up samples
+        frame = frames[iteration % len(frames)]
+
+        with timer.stage("decode"):
+            prepared = prepare_image(Image.open(io.BytesIO(frame)), max_side=args.max_side)
+        with timer.stage("seg_forward"):
+            logits = seg_model._forward([prepared.crop])
+        with timer.stage("logits_upsample"):
+            labels = seg_model._labels(logits[:1], prepared.crop.size)
+        with timer.stage("overlay_compose"):
+            display_arr, anonymized_arr = seg_model._compose(np.asarray(prepared.crop), labels)
+            display_overlay = prepared.uncrop(Image.fromarray(display_arr))
+            anonymized_overlay = prepared.uncrop(Image.fromarray(anonymized_arr))
+        with timer.stage("clip_image_embed"):
+            style_predictor._embed_image([prepared.crop])
+        with timer.stage("text_embed"):
+            style_predictor._embed_text_list(prompts)
+        with timer.stage("jpeg_encode"):
+            for overlay in (display_overlay, anonymized_overlay):
+                overlay.save(io.BytesIO(), format="JPEG", quality=95)
+        predictions = style_predictor.predict(prepared.crop)
+        with timer.stage("db_write"):
+            db.save_prediction(f"bench_{iteration}", "", "", predictions)
+
+        with timer.stage("end_to_end"):
+            prepared = prepare_image(Image.open(io.BytesIO(frame)), max_side=args.max_side)
+            predictions, display_overlay, anonymized_overlay, _ = classifier.classify(prepared)
+            for overlay in (display_overlay, anonymized_overlay):
+                overlay.save(io.BytesIO(), format="JPEG", quality=95)
+            db.save_prediction(f"bench_e2e_{iteration}", "", "", predictions)
+
+        with timer.stage("process_image"):
+            response = client.post("/process_image", data=frame, content_type="image/jpeg")
+            if response.status_code != 200:
+                raise RuntimeError(f"/process_image answered {response.status_code}: {response.get_data(as_text=True)}")
+
+    import flask_app
+    flask_app.persistence.close()
+    classifier.close()
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "models": args.models,
+            "seg_backend": args.seg_backend,
+            "clip_backend": args.clip_backend,
+            "upsample": args.upsample,
+            "concurrent": args.concurrent,
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "frame_source": str(args.images) if args.images else f"synthetic {args.width}x{args.height}",
+            "max_side": args.max_side,
+            "torch_threads": torch.get_num_threads(),
+            "cpu_count": os.cpu_count(),
+            "machine": platform.machine(),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "transformers": transformers.__version__,
+        },
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": timer.summary(),
+    }
+
+
+def _app_client(classifier: OutfitClassifier, data_dir: Path):
+    """
+    Flask test client for the real app, serving `classifier`
+
+    The app creates its database, image store and journal under the data
+    directory when imported, so config is re-read with a throw-away one
+    first (and the frame cache off, as the benchmark repeats its frames).
+    """
+    os.environ["FASHION_POLICE_DATA_DIR"] = str(data_dir)
+    os.environ["FASHION_POLICE_FRAME_CACHE_MAX_DISTANCE"] = "-1"
+    importlib.reload(config)
+    import flask_app
+
+    flask_app.models.factory = lambda: classifier
+    flask_app.models.warm_up = False
+    flask_app.models.load()
+    return flask_app.app.test_client()
+
+
+def print_report(report: Dict, baseline: Dict | None = None) -> None:
+    print(f"{'stage':<18}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rss +MB':>10}" + ("  p50 vs baseline" if baseline else ""))
+    for name, stats in report["stages"].items():
+        growth = f"{stats['rss_growth_mb']:>10.1f}" if stats.get("rss_growth_mb") is not None else f"{'-':>10}"
+        line = f"{name:<18}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{growth}"
+        base = (baseline or {}).get("stages", {}).get(name)
+        if base:
+            change = (stats["p50_ms"] - base["p50_ms"]) / max(base["p50_ms"], 1e-9) * 100
+            line += f"  {change:+.1f}%"
+        print(line)
+    print(f"peak RSS: {report['peak_rss_mb']:.0f} MB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the Fashion Police inference pipeline")
+    parser.add_argument("--models", choices=("stand-in", "real"), default="stand-in",
+                        help="tiny random stand-ins (no network) or the real models from the local cache")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--images", type=Path, default=None, help="Folder of frames to use instead of synthetic ones")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=960)
+    parser.add_argument("--max-side", type=int, default=1280)
+    parser.add_argument("--seg-backend", choices=BACKENDS, default="eager")
+    parser.add_argument("--clip-backend", choices=BACKENDS, default="eager")
+    parser.add_argument("--upsample", choices=("labels", "logits"), default="labels")
+    parser.add_argument("--concurrent", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads for the stage timings")
+    parser.add_argument("--output", type=Path, default=None, help="Write the JSON report here")
+    parser.add_argument("--baseline", type=Path, default=None, help="Earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    report = run(args)
+    baseline = json.loads(args.baseline.read_text()) if args.baseline else None
+    print_report(report, baseline)
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
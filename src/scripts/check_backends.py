@@ -0,0 +1,124 @@
+"""
+check_backends.py
+-----------------
+
+Accuracy check for the optimized inference backends.
+
+Runs every image in a local folder through the fp32 eager reference (with
+bilinear logit upsampling) and through a candidate configuration, then
+reports top-1 style agreement, segmentation pixel agreement and mIoU, and
+the average time per image of both.
+
+Usage
+-----
+    python -m src.scripts.check_backends data/images --seg-backend int8 --clip-backend int8
+    python -m src.scripts.check_backends data/images --upsample labels   # fast label upsampling vs logits
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+from PIL import Image
+
+from .backends import BACKENDS
+from .load_model import SegmentationModel
+from .style_predictor import StylePredictor
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def list_images(folder: Path, limit: int | None = None) -> List[Path]:
+    paths = sorted(p for p in folder.rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+    return paths[:limit] if limit else paths
+
+
+def mean_iou(confusion: np.ndarray) -> float:
+    """Mean IoU over the classes that occur in either prediction"""
+    intersection = np.diag(confusion)
+    union = confusion.sum(axis=0) + confusion.sum(axis=1) - intersection
+    present = union > 0
+    return float((intersection[present] / union[present]).mean()) if present.any() else 1.0
+
+
+def compare(
+    image_paths: List[Path],
+    seg_backend: str,
+    clip_backend: str,
+    upsample: str,
+) -> Dict:
+    ref_seg = SegmentationModel(backend="eager", upsample="logits")
+    ref_style = StylePredictor(backend="eager")
+    cand_seg = SegmentationModel(backend=seg_backend, upsample=upsample)
+    cand_style = StylePredictor(backend=clip_backend)
+
+    num_labels = len(SegmentationModel.id2label)
+    confusion = np.zeros((num_labels, num_labels), dtype=np.int64)
+    top1_matches = 0
+    score_diffs = []
+    timings = {"reference": 0.0, "candidate": 0.0}
+
+    for path in image_paths:
+        image = Image.open(path).convert("RGB")
+
+        start = time.perf_counter()
+        ref_labels = ref_seg.segment(image)[0]
+        ref_preds = ref_style.predict(image)
+        timings["reference"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        cand_labels = cand_seg.segment(image)[0]
+        cand_preds = cand_style.predict(image)
+        timings["candidate"] += time.perf_counter() - start
+
+        confusion += np.bincount(
+            ref_labels.astype(np.int64).ravel() * num_labels + cand_labels.ravel(),
+            minlength=num_labels * num_labels,
+        ).reshape(num_labels, num_labels)
+        top1_matches += ref_preds[0]["name"] == cand_preds[0]["name"]
+        ref_scores = {p["name"]: p["score"] for p in ref_preds}
+        score_diffs.append(max(abs(ref_scores[p["name"]] - p["score"]) for p in cand_preds))
+
+    count = max(1, len(image_paths))
+    return {
+        "images": len(image_paths),
+        "seg_backend": seg_backend,
+        "clip_backend": clip_backend,
+        "upsample": upsample,
+        "top1_agreement": top1_matches / count,
+        "max_score_diff": max(score_diffs, default=0.0),
+        "pixel_agreement": float(np.diag(confusion).sum() / max(1, confusion.sum())),
+        "seg_miou": mean_iou(confusion),
+        "reference_seconds_per_image": timings["reference"] / count,
+        "candidate_seconds_per_image": timings["candidate"] / count,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare an inference backend against the fp32 reference")
+    parser.add_argument("folder", type=Path, help="Folder of test images")
+    parser.add_argument("--seg-backend", choices=BACKENDS, default="eager")
+    parser.add_argument("--clip-backend", choices=BACKENDS, default="eager")
+    parser.add_argument("--upsample", choices=("labels", "logits"), default="labels")
+    parser.add_argument("--limit", type=int, default=None, help="Only use the first N images")
+    parser.add_argument("--json", type=Path, default=None, help="Also write the report to this file")
+    args = parser.parse_args()
+
+    image_paths = list_images(args.folder, args.limit)
+    if not image_paths:
+        parser.error(f"No images found in {args.folder}")
+
+    report = compare(image_paths, args.seg_backend, args.clip_backend, args.upsample)
+    for key, value in report.items():
+        print(f"{key:>28}: {value:.4f}" if isinstance(value, float) else f"{key:>28}: {value}")
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -8,18 +8,61 @@ unified class, `OutfitClassifier`, that performs both tasks on a given image.
 Usage
 -----
 >>> classifier = OutfitClassifier()
->>> predictions, overlay = classifier.classify(image)
+>>> predictions, display_overlay, anonymized_overlay, embedding = classifier.classify(image)
 >>> print(predictions[0])  # highest-scoring style
->>> overlay.show()
+>>> display_overlay.show()
+
+The two models are independent, so by default they run concurrently on two
+dedicated worker threads, each with its own share of torch intra-op threads.
+Wall-clock latency is then roughly max(segmentation, style) instead of the sum.
 """
 
 from __future__ import annotations
 
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 from typing import List, Dict, Tuple
+import numpy as np
+import torch
 
+from .. import config, metrics
 from .load_model import SegmentationModel
 from .style_predictor import StylePredictor
+from .preprocess import PreparedImage, prepare_image
+
+BATCH_SIZE = metrics.histogram(
+    "fashion_batch_size", "Images per classify_batch call", buckets=(1, 2, 4, 8, 16, 32)
+)
+
+
+def default_thread_split(cpu_count: int | None = None) -> Tuple[int, int]:
+    """
+    Split the available cores between the segmentation and CLIP branches.
+
+    SegFormer at 512x512 costs an order of magnitude more FLOPs than the
+    CLIP ViT-B/32 image encoder, so it gets the larger share.
+    """
+    cpu_count = cpu_count or os.cpu_count() or 1
+    clip_threads = max(1, cpu_count // 4)
+    seg_threads = max(1, cpu_count - clip_threads)
+    return seg_threads, clip_threads
+
+
+def _parse_thread_split(value: str) -> Tuple[int, int] | None:
+    if not value:
+        return None
+    seg_threads, clip_threads = (int(part) for part in value.split(","))
+    return seg_threads, clip_threads
+
+
+def _pin_torch_threads(num_threads: int) -> None:
+    """Executor initializer: give this worker thread its own intra-op budget"""
+    # Run one parallel op first so torch's lazy per-thread init does not
+    # later overwrite the value we set here.
+    torch.ones(64, 64).sum()
+    torch.set_num_threads(num_threads)
 
 
 class OutfitClassifier:
@@ -29,22 +72,113 @@ class OutfitClassifier:
     This is the main entry point for Fashion Police's ML pipeline.
     """
 
-    def __init__(self) -> None:
-        """Initialize both the segmentation model and the style predictor."""
-        print("Loading segmentation model...")
-        self.seg_model = SegmentationModel()
-        print("Loading FashionCLIP style predictor...")
-        self.style_predictor = StylePredictor()
+    def __init__(
+        self,
+        concurrent: bool = config.CONCURRENT_INFERENCE,
+        thread_split: Tuple[int, int] | None = _parse_thread_split(config.THREAD_SPLIT),
+        seg_model: SegmentationModel | None = None,
+        style_predictor: StylePredictor | None = None,
+        degraded_seg_model: str = config.DEGRADED_SEG_MODEL,
+        degraded_skip_display: bool = config.DEGRADED_SKIP_DISPLAY,
+    ) -> None:
+        """
+        Initialize both the segmentation model and the style predictor.
+
+        Parameters
+        ----------
+        concurrent : bool
+            Run segmentation and style prediction at the same time.
+        thread_split : (int, int), optional
+            Intra-op torch threads for the (segmentation, style) branches
+            in concurrent mode. Defaults to `default_thread_split()`.
+        seg_model, style_predictor : optional
+            Pre-built models to use instead of the configured defaults.
+        degraded_seg_model : str
+            Smaller SegFormer checkpoint used by `classify_batch(degraded=True)`
+            (empty = the regular segmentation model).
+        degraded_skip_display : bool
+            In degraded mode, skip the colored display overlay and return the
+            anonymized overlay in its place.
+        """
+        # The models are independent, so load (and convert) them side by side
+        print("Loading segmentation model and FashionCLIP style predictor...")
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix="model-load") as pool:
+            seg_future = pool.submit(SegmentationModel) if seg_model is None else None
+            style_future = pool.submit(StylePredictor) if style_predictor is None else None
+            degraded_future = (
+                pool.submit(SegmentationModel, model_name=degraded_seg_model, revision="")
+                if degraded_seg_model else None
+            )
+            self.seg_model = seg_model or seg_future.result()
+            self.style_predictor = style_predictor or style_future.result()
+            self.degraded_seg_model = degraded_future.result() if degraded_future else self.seg_model
+        self.degraded_skip_display = degraded_skip_display
+
+        self.concurrent = concurrent
+        self.thread_split = thread_split or default_thread_split()
+        self._seg_executor: ThreadPoolExecutor | None = None
+        self._style_executor: ThreadPoolExecutor | None = None
+        self._executor_pid: int | None = None
+        self._executor_lock = threading.Lock()
+        if concurrent:
+            seg_threads, clip_threads = self.thread_split
+            print(f"Concurrent inference enabled (torch threads: segmentation={seg_threads}, style={clip_threads})")
         print("Outfit classifier ready!")
 
-    def classify(self, image: Image.Image) -> Tuple[List[Dict], Image.Image, Image.Image]:
+    def _executors(self) -> Tuple[ThreadPoolExecutor, ThreadPoolExecutor]:
+        """
+        The two branch executors, created on first use in this process.
+
+        Worker threads do not survive fork(), so a pre-fork server's workers
+        each build their own instead of inheriting the master's dead ones.
+        """
+        with self._executor_lock:
+            if self._executor_pid != os.getpid():
+                self._start_executors()
+            return self._seg_executor, self._style_executor
+
+    def _start_executors(self) -> None:
+        seg_threads, clip_threads = self.thread_split
+        self._seg_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="segmentation",
+            initializer=_pin_torch_threads, initargs=(seg_threads,)
+        )
+        self._style_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="style",
+            initializer=_pin_torch_threads, initargs=(clip_threads,)
+        )
+        self._executor_pid = os.getpid()
+
+    def set_thread_budget(self, num_threads: int) -> None:
+        """
+        Limit this process to `num_threads` intra-op threads in total, e.g.
+        cores // workers when several server processes share one machine.
+        """
+        torch.set_num_threads(num_threads)
+        self.thread_split = default_thread_split(num_threads)
+        self._shutdown_executors()
+
+    def warm_up(self) -> None:
+        """
+        Run one blank frame through the whole pipeline so the first visitor
+        does not pay for one-time allocations and worker thread start-up.
+        """
+        with metrics.stage("warm_up"):
+            self._classify_batch([Image.new("RGB", (384, 512), (128, 128, 128))])
+            if self.degraded_seg_model is not self.seg_model:
+                self._classify_batch([Image.new("RGB", (384, 512), (128, 128, 128))], degraded=True)
+
+    def classify(
+        self, image: Image.Image | PreparedImage
+    ) -> Tuple[List[Dict], Image.Image, Image.Image, np.ndarray]:
         """
         Classify the outfit in the image into fashion styles.
 
         Parameters
         ----------
-        image : PIL.Image
-            The input image containing a person wearing clothing.
+        image : PIL.Image or PreparedImage
+            The input image containing a person wearing clothing, optionally
+            already cropped to the person by `prepare_image()`.
 
         Returns
         -------
@@ -62,11 +196,76 @@ class OutfitClassifier:
         anonymized_overlay : PIL.Image
             A privacy-preserving version with only background (white) and
             face (black) colored, keeping clothing as original (for storage).
+
+        embedding : np.ndarray
+            The normalized CLIP image embedding of the person crop, kept in
+            the EmbeddingStore so the record can be re-scored without
+            running CLIP again.
         """
-        # Run segmentation to get both overlays
-        _, display_overlay, anonymized_overlay = self.seg_model.segment(image)
-        
-        # Run style prediction
-        predictions = self.style_predictor.predict(image)
-        
-        return predictions, display_overlay, anonymized_overlay
+        return self.classify_batch([image])[0]
+
+    def classify_batch(
+        self, images: List[Image.Image | PreparedImage], degraded: bool = False
+    ) -> List[Tuple[List[Dict], Image.Image, Image.Image, np.ndarray]]:
+        """
+        Classify several images at once, running each model as a single
+        batched forward pass. Returns one `classify()` tuple per image.
+
+        Both models see the person crop of each image; the overlays are
+        mapped back onto the full frame.
+
+        degraded: cheaper pipeline for overload (see AdmissionController):
+        the degraded segmentation model, and the anonymized overlay in place
+        of the display overlay if `degraded_skip_display` is set.
+        """
+        BATCH_SIZE.observe(len(images))
+        with metrics.stage("classify"):
+            return self._classify_batch(images, degraded)
+
+    def _classify_batch(
+        self, images: List[Image.Image | PreparedImage], degraded: bool = False
+    ) -> List[Tuple[List[Dict], Image.Image, Image.Image, np.ndarray]]:
+        # Decoding happens here, before the two branches share the crops
+        prepared = [
+            image if isinstance(image, PreparedImage) else prepare_image(image)
+            for image in images
+        ]
+        crops = [item.crop for item in prepared]
+        seg_model = self.degraded_seg_model if degraded else self.seg_model
+        display = not (degraded and self.degraded_skip_display)
+
+        if self.concurrent:
+            seg_executor, style_executor = self._executors()
+            seg_future = seg_executor.submit(seg_model.segment_batch, crops, display)
+            style_future = style_executor.submit(self.style_predictor.embed_images, crops)
+            segmentations = seg_future.result()
+            image_embeds = style_future.result()
+        else:
+            # Run segmentation to get both overlays
+            segmentations = seg_model.segment_batch(crops, display)
+
+            # Run style prediction
+            image_embeds = self.style_predictor.embed_images(crops)
+
+        batch_predictions = self.style_predictor.predictions_from_embeddings(image_embeds)
+        embeddings = image_embeds.cpu().numpy()
+        results = []
+        for item, predictions, (_, display_overlay, anonymized_overlay), embedding in zip(
+            prepared, batch_predictions, segmentations, embeddings
+        ):
+            anonymized_overlay = item.uncrop(anonymized_overlay)
+            display_overlay = item.uncrop(display_overlay) if display_overlay is not None else anonymized_overlay
+            results.append((predictions, display_overlay, anonymized_overlay, embedding))
+        return results
+
+    def _shutdown_executors(self) -> None:
+        if self._executor_pid == os.getpid():
+            for executor in (self._seg_executor, self._style_executor):
+                executor.shutdown(wait=True)
+        self._seg_executor = self._style_executor = None
+        self._executor_pid = None
+
+    def close(self) -> None:
+        """Shut down the worker threads used in concurrent mode."""
+        self._shutdown_executors()
+        self.concurrent = False
@@ -0,0 +1,161 @@
+"""
+export_dataset.py
+-----------------
+
+Streams the prediction history out of FashionDB as a training dataset.
+
+Records are read one keyset page at a time (``FashionDB.iter_predictions``)
+and written as they are read, so memory stays bounded by ``--page-size``
+however many months of history the kiosk holds. Each row has the record's
+timestamp, predictions and user correction, plus optionally:
+
+* ``--images``      the stored anonymized overlay (``image_path``, null once
+                    evicted) and the best remaining overlay (``overlay_path``,
+                    possibly a thumbnail)
+* ``--embeddings``  the record's CLIP image embedding from the EmbeddingStore
+
+JSONL is always available. Parquet (one row group per page) needs
+``pyarrow``, which is not a runtime dependency of the app.
+
+Usage
+-----
+    python -m src.scripts.export_dataset --output history.jsonl
+    python -m src.scripts.export_dataset --output history.parquet --images --embeddings
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from .. import config
+from ..database import FashionDB
+from ..embedding_store import EmbeddingStore
+
+COLUMNS = [
+    "record_id", "timestamp", "top_prediction", "top_confidence",
+    "predictions", "user_correction", "feedback_timestamp",
+]
+IMAGE_COLUMNS = ["image_path", "overlay_path"]
+
+
+def export_rows(
+    db: FashionDB,
+    store: Optional[EmbeddingStore],
+    images: bool,
+    page_size: int,
+) -> Iterator[List[Dict]]:
+    """Yield the dataset rows, one DB page at a time"""
+    for records in db.iter_predictions(page_size):
+        found = {}
+        if store is not None:
+            for chunk_ids, embeds in store.iter_chunks([record["record_id"] for record in records]):
+                found.update(zip(chunk_ids, embeds))
+        rows = []
+        for record in records:
+            row = {
+                "record_id": record["record_id"],
+                "timestamp": record["timestamp"],
+                "top_prediction": record["top_prediction"],
+                "top_confidence": record["top_confidence"],
+                "predictions": record["all_predictions"],
+                "user_correction": record["user_correction"],
+                "feedback_timestamp": record["feedback_timestamp"],
+            }
+            if images:
+                row["image_path"] = record["image_path"]
+                row["overlay_path"] = record["overlay_path"]
+            if store is not None:
+                embedding = found.get(record["record_id"])
+                row["embedding"] = embedding.tolist() if embedding is not None else None
+            rows.append(row)
+        yield rows
+
+
+def write_jsonl(pages: Iterator[List[Dict]], path: Path, columns: List[str]) -> int:
+    written = 0
+    with open(path, "w") as f:
+        for rows in pages:
+            for row in rows:
+                f.write(json.dumps({name: row[name] for name in columns}) + "\n")
+            written += len(rows)
+    return written
+
+
+def write_parquet(pages: Iterator[List[Dict]], path: Path, columns: List[str]) -> int:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Parquet export needs pyarrow (pip install pyarrow), or export to .jsonl instead")
+
+    schema = pa.schema([
+        pa.field(name, pa.float64() if name == "top_confidence"
+                 else pa.list_(pa.float32()) if name == "embedding"
+                 else pa.string())
+        for name in columns
+    ])
+    written = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in pages:
+            for row in rows:
+                # Predictions carry free-form fields (descriptions): keep them as JSON text
+                row["predictions"] = json.dumps(row["predictions"])
+            writer.write_table(pa.table({name: [row[name] for row in rows] for name in columns}, schema=schema))
+            written += len(rows)
+    return written
+
+
+def run(args: argparse.Namespace) -> Dict:
+    db = FashionDB(args.db)
+    store = None
+    if args.embeddings:
+        directory = args.embedding_dir or Path(args.db).parent / "embeddings"
+        store = EmbeddingStore(directory)
+        if store.model:
+            print(f"Embeddings: {store.model} ({store.dim} dimensions)")
+
+    columns = COLUMNS + (IMAGE_COLUMNS if args.images else []) + (["embedding"] if store is not None else [])
+    output_format = args.format or ("parquet" if args.output.suffix == ".parquet" else "jsonl")
+    write = write_parquet if output_format == "parquet" else write_jsonl
+
+    # Write next to the output and rename at the end, so a partial export never looks complete
+    tmp_path = args.output.with_name(f".{args.output.name}.tmp{os.getpid()}")
+    start = time.perf_counter()
+    try:
+        written = write(export_rows(db, store, args.images, args.page_size), tmp_path, columns)
+        os.replace(tmp_path, args.output)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return {"records": written, "format": output_format, "seconds": time.perf_counter() - start}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export the prediction history as a JSONL or Parquet dataset")
+    parser.add_argument("--db", type=Path, default=config.DATA_DIR / "predictions.db")
+    parser.add_argument("--output", type=Path, required=True, help="Output file (.jsonl or .parquet)")
+    parser.add_argument("--format", choices=("jsonl", "parquet"), default=None,
+                        help="Output format (default: from the output suffix)")
+    parser.add_argument("--images", action="store_true", help="Include stored overlay paths")
+    parser.add_argument("--embeddings", action="store_true", help="Include CLIP image embeddings")
+    parser.add_argument("--embedding-dir", type=Path, default=None,
+                        help="EmbeddingStore directory (default: embeddings/ next to the DB)")
+    parser.add_argument("--page-size", type=int, default=1000, help="Records read and written at a time")
+    args = parser.parse_args()
+
+    if args.embedding_dir and not args.embeddings:
+        parser.error("--embedding-dir needs --embeddings")
+    if not args.db.exists():
+        parser.error(f"{args.db} does not exist")
+
+    report = run(args)
+    print(f"Exported {report['records']} records to {args.output} ({report['format']}) in {report['seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
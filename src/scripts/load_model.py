@@ -1,13 +1,25 @@
 ﻿from __future__ import annotations
-from typing import Tuple, List
+from typing import Callable, Dict, Tuple, List
+import threading
+import time
 import numpy as np
 from PIL import Image
 from transformers import SegformerImageProcessor, AutoModelForSemanticSegmentation
 import torch
+from .. import config, metrics
+from .backends import SegmentationLogits, load_backend
+from .snapshots import from_pretrained, model_id
+
+BACKGROUND_LABEL = 0
+FACE_LABEL = 11
+
+# Opacity of the palette colour over clothing regions in the display overlay
+OVERLAY_ALPHA = 0.4
 
 class SegmentationModel:
-    _processor: SegformerImageProcessor | None = None
-    _model: AutoModelForSemanticSegmentation | None = None
+    # Loaded (processor, logits function) pairs per (model id, backend), shared by every instance
+    _loaded: Dict[Tuple[str, str], Tuple[SegformerImageProcessor, Callable[[torch.Tensor], torch.Tensor]]] = {}
+    _load_lock = threading.Lock()
     
     id2label: dict[int, str] = {
         0: "Background", 1: "Hat", 2: "Hair", 3: "Sunglasses",
@@ -25,61 +37,122 @@ class SegmentationModel:
         (0, 255, 255), (255, 20, 147)
     ]
     
-    def __init__(self, model_name: str = "mattmdjaga/segformer_b2_clothes") -> None:
+    def __init__(
+        self,
+        model_name: str = config.SEG_MODEL_NAME,
+        upsample: str = config.SEG_UPSAMPLE,
+        backend: str = config.SEG_BACKEND,
+        revision: str = config.SEG_MODEL_REVISION
+    ) -> None:
+        """
+        upsample: "labels" takes the argmax at logit resolution and upsamples
+        the uint8 label map (fast); "logits" upsamples the float logits
+        bilinearly before the argmax (slightly smoother edges, much slower)
+        
+        backend: "eager" (fp32), "int8" (dynamically quantized linear layers)
+        or "torchscript" (traced graph), see backends.py
+        
+        revision: pinned Hub revision, loaded from the local snapshot cache
+        """
+        if upsample not in ("labels", "logits"):
+            raise ValueError(f"upsample must be 'labels' or 'logits', got {upsample!r}")
         self.model_name = model_name
-        self._ensure_loaded()
+        self.upsample = upsample
+        self.backend = backend
+        self.revision = revision
+        self._processor, self._logits_fn = self._ensure_loaded(model_name, backend, revision)
+        self._build_luts()
+    
+    def _build_luts(self) -> None:
+        """Per-label colour / opacity lookup tables used to compose both overlays in one pass"""
+        palette_arr = np.array(self.palette, dtype=np.uint16)
+        labels = np.arange(256)
+        self._colour_lut = palette_arr[labels % len(palette_arr)]
+        self._colour_lut[BACKGROUND_LABEL] = (255, 255, 255)
+        self._colour_lut[FACE_LABEL] = (0, 0, 0)
+        # Background and face are painted solid, clothing is blended
+        self._solid_lut = np.zeros(256, dtype=bool)
+        self._solid_lut[[BACKGROUND_LABEL, FACE_LABEL]] = True
+        self._alpha_lut = np.where(self._solid_lut, 255, round(OVERLAY_ALPHA * 255)).astype(np.uint16)
     
     @classmethod
-    def _ensure_loaded(cls) -> None:
-        if cls._processor is None or cls._model is None:
-            cls._processor = SegformerImageProcessor.from_pretrained("mattmdjaga/segformer_b2_clothes")
-            cls._model = AutoModelForSemanticSegmentation.from_pretrained("mattmdjaga/segformer_b2_clothes")
-            cls._model.eval()
+    def _ensure_loaded(cls, model_name: str, backend: str, revision: str = ""):
+        key = (model_id(model_name, revision), backend)
+        with cls._load_lock:
+            if key not in cls._loaded:
+                start = time.perf_counter()
+                processor = from_pretrained(SegformerImageProcessor, model_name, revision)
+                model = from_pretrained(AutoModelForSemanticSegmentation, model_name, revision)
+                model.eval()
+                example = torch.zeros(1, 3, processor.size["height"], processor.size["width"])
+                logits_fn = load_backend(SegmentationLogits(model), backend, (example,), key[0])
+                cls._loaded[key] = (processor, logits_fn)
+                metrics.MODEL_LOAD_SECONDS.set(time.perf_counter() - start, model=f"{key[0]}:{backend}")
+            return cls._loaded[key]
     
     def segment(self, image: Image.Image) -> Tuple[np.ndarray, Image.Image, Image.Image]:
-        inputs = self._processor(images=image, return_tensors="pt")
-        with torch.no_grad():
-            outputs = self._model(**inputs)
-        logits = outputs.logits
-        upsampled_logits = torch.nn.functional.interpolate(
-            logits, size=image.size[::-1], mode="bilinear", align_corners=False
-        )
-        pred_seg = upsampled_logits.argmax(dim=1)[0].cpu().numpy().astype(np.uint8)
-        
-        # Create display overlay (with colored clothing) starting from original image
-        display_overlay = image.convert("RGB").copy()
-        display_arr = np.array(display_overlay)
-        
-        # Create anonymized overlay (only background and face colored)
-        anonymized_overlay = image.convert("RGB").copy()
-        anonymized_arr = np.array(anonymized_overlay)
-        
-        # Make face (class 11) solid black in both overlays
-        face_mask = pred_seg == 11
-        display_arr[face_mask] = [0, 0, 0]
-        anonymized_arr[face_mask] = [0, 0, 0]
-        
-        # Make background (class 0) solid white in both overlays
-        bg_mask = pred_seg == 0
-        display_arr[bg_mask] = [255, 255, 255]
-        anonymized_arr[bg_mask] = [255, 255, 255]
-        
-        # For display overlay: blend clothing regions with transparency
-        palette_arr = np.array(self.palette, dtype=np.uint8)
-        colours = palette_arr[pred_seg % len(palette_arr)]
-        colour_image = Image.fromarray(colours, mode="RGB")
+        return self.segment_batch([image])[0]
+    
+    def segment_batch(
+        self, images: List[Image.Image], display: bool = True
+    ) -> List[Tuple[np.ndarray, Image.Image | None, Image.Image]]:
+        """
+        Segment several images with a single batched forward pass
         
-        # Apply transparent overlay only to non-face, non-background regions (display only)
-        other_mask = ~(face_mask | bg_mask)
-        if other_mask.any():
-            display_img = Image.fromarray(display_arr)
-            blended = Image.blend(display_img, colour_image, alpha=0.4)
-            blended_arr = np.array(blended)
-            display_arr[other_mask] = blended_arr[other_mask]
+        display: also blend the colored display overlay (None otherwise)
+        """
+        logits = self._forward(images)
+        return [
+            self._render(image, image_logits.unsqueeze(0), display)
+            for image, image_logits in zip(images, logits)
+        ]
+    
+    def _forward(self, images: List[Image.Image]) -> torch.Tensor:
+        """Run the model and return logits at model resolution, shape (N, labels, h, w)"""
+        with metrics.stage("seg_forward"):
+            inputs = self._processor(images=images, return_tensors="pt")
+            with torch.no_grad():
+                return self._logits_fn(inputs["pixel_values"])
+    
+    def _render(
+        self, image: Image.Image, logits: torch.Tensor, display: bool = True
+    ) -> Tuple[np.ndarray, Image.Image | None, Image.Image]:
+        with metrics.stage("logits_upsample"):
+            pred_seg = self._labels(logits, image.size)
+        with metrics.stage("overlay_compose"):
+            display_arr, anonymized_arr = self._compose(np.asarray(image.convert("RGB")), pred_seg, display)
+            display_overlay = Image.fromarray(display_arr) if display_arr is not None else None
+            return pred_seg, display_overlay, Image.fromarray(anonymized_arr)
+    
+    def _labels(self, logits: torch.Tensor, size: Tuple[int, int]) -> np.ndarray:
+        """Turn (1, labels, h, w) logits into a uint8 label map of the given (width, height)"""
+        if self.upsample == "logits":
+            upsampled_logits = torch.nn.functional.interpolate(
+                logits, size=size[::-1], mode="bilinear", align_corners=False
+            )
+            return upsampled_logits.argmax(dim=1)[0].cpu().numpy().astype(np.uint8)
         
-        # For anonymized overlay: keep original clothing (no coloring)
-        # anonymized_arr already has original image for clothing regions
+        labels = logits.argmax(dim=1)[0].cpu().numpy().astype(np.uint8)
+        height, width = labels.shape
+        # Nearest-neighbour lookup with pixel-centre alignment, matching the
+        # geometry of bilinear interpolation with align_corners=False
+        rows = np.minimum(((np.arange(size[1]) + 0.5) * height / size[1]).astype(np.intp), height - 1)
+        cols = np.minimum(((np.arange(size[0]) + 0.5) * width / size[0]).astype(np.intp), width - 1)
+        return labels[rows[:, None], cols[None, :]]
+    
+    def _compose(
+        self, rgb: np.ndarray, pred_seg: np.ndarray, display: bool = True
+    ) -> Tuple[np.ndarray | None, np.ndarray]:
+        """
+        Build both overlays in a single vectorised pass
         
-        display_overlay = Image.fromarray(display_arr)
-        anonymized_overlay = Image.fromarray(anonymized_arr)
-        return pred_seg, display_overlay, anonymized_overlay
+        display: background white, face black, clothing blended with its palette colour
+        anonymized: background white, face black, clothing left as in the photo
+        """
+        colours = self._colour_lut[pred_seg]
+        display_arr = None
+        if display:
+            alpha = self._alpha_lut[pred_seg][..., None]
+            display_arr = ((rgb * (255 - alpha) + colours * alpha + 127) // 255).astype(np.uint8)
+        anonymized_arr = np.where(self._solid_lut[pred_seg][..., None], colours, rgb).astype(np.uint8)
+        return display_arr, anonymized_arr
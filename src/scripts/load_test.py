@@ -0,0 +1,239 @@
+"""
+load_test.py
+------------
+
+Throughput load test for the pre-fork server.
+
+For each requested worker count, starts ``gunicorn -c gunicorn.conf.py``
+on a local port with a throw-away data directory, waits for ``/ready``,
+then keeps ``--concurrency`` clients posting synthetic JPEG frames to
+``/process_image`` for ``--duration`` seconds. Reports requests/s, latency
+percentiles and the speed-up over the first worker count, which shows how
+throughput scales with workers on a multi-core box.
+
+The frame cache is turned off in the servers it starts, and the synthetic
+frames are perceptually distinct anyway, so every request runs the models.
+
+``--models stand-in`` serves the benchmark's tiny random stand-in models
+(no network or model cache needed) through the ``stand_in_app()`` gunicorn
+app factory; it measures the server, scheduler and storage overhead rather
+than real inference.
+
+``--url`` load-tests an already running server instead (one row, no
+server management).
+
+Usage
+-----
+    python -m src.scripts.load_test --workers 1 2 4 --concurrency 8 --duration 30
+    python -m src.scripts.load_test --models stand-in --workers 1 2 4 --duration 10
+    python -m src.scripts.load_test --url http://localhost:5000 --concurrency 4 --output load.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Dict, List
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from .. import config
+from .benchmark import build_stand_in_models, synthetic_images
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+
+def stand_in_app():
+    """
+    gunicorn app factory: the real app, with the outfit classifier built
+    from the benchmark's stand-in models
+
+        gunicorn -c gunicorn.conf.py "src.scripts.load_test:stand_in_app()"
+    """
+    import flask_app
+    from .classify_outfit import OutfitClassifier
+
+    def factory() -> OutfitClassifier:
+        work_dir = config.DATA_DIR / "stand-in"
+        work_dir.mkdir(parents=True, exist_ok=True)
+        seg_model, style_predictor = build_stand_in_models(config.SEG_BACKEND, config.CLIP_BACKEND, work_dir)
+        return OutfitClassifier(seg_model=seg_model, style_predictor=style_predictor, degraded_seg_model="")
+
+    flask_app.models.factory = factory
+    return flask_app.app
+
+
+def wait_until_ready(url: str, timeout: float, server: subprocess.Popen | None = None) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode} before becoming ready")
+        try:
+            with urllib.request.urlopen(url + "/ready", timeout=5) as response:
+                if response.status == 200:
+                    return
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} was not ready after {timeout:.0f}s")
+
+
+def drive(url: str, frames: List[bytes], concurrency: int, duration: float) -> Dict:
+    """Closed-loop load: each client sends its next request as soon as the last one returns"""
+    parts = urlsplit(url)
+    deadline = time.monotonic() + duration
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    lock = threading.Lock()
+
+    def client(index: int) -> None:
+        connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=120)
+        sent = 0
+        while time.monotonic() < deadline:
+            frame = frames[(index + sent) % len(frames)]
+            sent += 1
+            start = time.perf_counter()
+            try:
+                connection.request("POST", "/process_image", body=frame, headers={"Content-Type": "image/jpeg"})
+                response = connection.getresponse()
+                response.read()
+                status = str(response.status)
+            except (OSError, http.client.HTTPException) as e:
+                connection.close()
+                status = type(e).__name__
+            elapsed = time.perf_counter() - start
+            with lock:
+                if status == "200":
+                    latencies.append(elapsed)
+                else:
+                    errors[status] = errors.get(status, 0) + 1
+        connection.close()
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.monotonic() - start
+
+    values = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": wall,
+        "requests_per_second": len(latencies) / wall,
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+    }
+
+
+def run_with_server(args: argparse.Namespace, workers: int, frames: List[bytes]) -> Dict:
+    data_dir = Path(tempfile.mkdtemp(prefix="fashion-load-"))
+    env = dict(
+        os.environ,
+        FASHION_POLICE_WORKERS=str(workers),
+        FASHION_POLICE_BIND=f"127.0.0.1:{args.port}",
+        FASHION_POLICE_DATA_DIR=str(data_dir),
+        # Measure the pipeline, not retakes served from the near-duplicate frame cache
+        FASHION_POLICE_FRAME_CACHE_MAX_DISTANCE="-1",
+        # Keep reusing the real caches so each run does not re-convert the models
+        FASHION_POLICE_EMBEDDING_CACHE_DIR=str(config.EMBEDDING_CACHE_DIR.resolve()),
+        FASHION_POLICE_BACKEND_CACHE_DIR=str(config.BACKEND_CACHE_DIR.resolve()),
+    )
+    url = f"http://127.0.0.1:{args.port}"
+    command = [sys.executable, "-m", "gunicorn", "-c", str(args.config)]
+    if args.models == "stand-in":
+        command.append("src.scripts.load_test:stand_in_app()")
+    server = subprocess.Popen(
+        command,
+        cwd=REPO_ROOT, env=env,
+        stdout=subprocess.DEVNULL if not args.verbose else None,
+        stderr=subprocess.STDOUT if not args.verbose else None,
+    )
+    try:
+        wait_until_ready(url, args.startup_timeout, server)
+        drive(url, frames, args.concurrency, args.warmup)  # every worker warm, not recorded
+        return drive(url, frames, args.concurrency, args.duration)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def print_report(rows: List[Dict]) -> None:
+    print(f"{'workers':>8}{'req/s':>10}{'speed-up':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    base = rows[0]["requests_per_second"] or 1e-9
+    for row in rows:
+        print(
+            f"{str(row['workers']):>8}{row['requests_per_second']:>10.2f}{row['requests_per_second'] / base:>9.2f}x"
+            f"{row['p50_ms']:>10.0f}{row['p95_ms']:>10.0f}{row['p99_ms']:>10.0f}{sum(row['errors'].values()):>8}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure /process_image throughput against worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Worker counts to compare")
+    parser.add_argument("--url", default=None, help="Test an already running server instead of starting gunicorn")
+    parser.add_argument("--models", choices=("real", "stand-in"), default="real",
+                        help="real models from the local cache, or tiny random stand-ins (no network)")
+    parser.add_argument("--config", type=Path, default=REPO_ROOT / "gunicorn.conf.py")
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--concurrency", type=int, default=8, help="Simultaneous clients")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds per run")
+    parser.add_argument("--warmup", type=float, default=5, help="Unrecorded seconds of load before measuring")
+    parser.add_argument("--startup-timeout", type=float, default=600)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=960)
+    parser.add_argument("--output", type=Path, default=None, help="Write the JSON report here")
+    parser.add_argument("--verbose", action="store_true", help="Show the server's log output")
+    args = parser.parse_args()
+    if args.url and args.models == "stand-in":
+        parser.error("--models stand-in applies to the servers this script starts, not to --url")
+
+    frames = synthetic_images(8, (args.width, args.height))
+    rows = []
+    if args.url:
+        url = args.url.rstrip("/")
+        wait_until_ready(url, args.startup_timeout)
+        drive(url, frames, args.concurrency, args.warmup)
+        rows.append({"workers": "?", **drive(url, frames, args.concurrency, args.duration)})
+    else:
+        for workers in args.workers:
+            print(f"Running with {workers} worker(s)...")
+            rows.append({"workers": workers, **run_with_server(args, workers, frames)})
+
+    print_report(rows)
+    if args.output:
+        report = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "cpu_count": os.cpu_count(),
+                "concurrency": args.concurrency,
+                "duration": args.duration,
+                "frame_size": f"{args.width}x{args.height}",
+                "models": args.models if not args.url else None,
+            },
+            "runs": rows,
+        }
+        args.output.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
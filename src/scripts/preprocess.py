@@ -0,0 +1,100 @@
+"""
+preprocess.py
+-------------
+
+Shared input preparation for the inference pipeline.
+
+The uploaded frame is decoded once, capped to a maximum side length and
+cropped to the person's bounding box (as computed by the camera page). Both
+`SegmentationModel` and `StylePredictor` then run on the same crop, and the
+overlays are pasted back so they line up with the (capped) full frame.
+
+Usage
+-----
+>>> prepared = prepare_image(image, box=(120, 40, 520, 470), max_side=1280)
+>>> prepared.crop.size
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Tuple
+
+from PIL import Image
+
+Box = Tuple[int, int, int, int]
+
+
+@dataclass
+class PreparedImage:
+    """
+    A decoded frame plus the region the models should look at.
+
+    frame : full RGB frame, downscaled to the requested max side
+    box : person box (left, top, right, bottom) in `frame` coordinates
+    crop : `frame` cropped to `box`; this is what both models see
+    """
+
+    frame: Image.Image
+    box: Box
+    crop: Image.Image
+
+    def uncrop(self, overlay: Image.Image, fill: Tuple[int, int, int] = (255, 255, 255)) -> Image.Image:
+        """Paste an overlay of `crop` back into a frame-sized image (outside the box = background)."""
+        if self.box == (0, 0) + self.frame.size:
+            return overlay
+        canvas = Image.new("RGB", self.frame.size, fill)
+        canvas.paste(overlay, self.box[:2])
+        return canvas
+
+
+def clamp_box(box: Box | None, size: Tuple[int, int], min_side: int = 32) -> Box:
+    """Clamp a box to the image; fall back to the full image if it is missing or degenerate."""
+    width, height = size
+    if box is None:
+        return 0, 0, width, height
+    left, top, right, bottom = (int(round(v)) for v in box)
+    left, right = max(0, min(left, right)), min(width, max(left, right))
+    top, bottom = max(0, min(top, bottom)), min(height, max(top, bottom))
+    if right - left < min_side or bottom - top < min_side:
+        return 0, 0, width, height
+    return left, top, right, bottom
+
+
+def prepare_image(image: Image.Image, box: Box | None = None, max_side: int | None = None) -> PreparedImage:
+    """
+    Decode, downscale and crop an input image once for the whole pipeline.
+
+    Parameters
+    ----------
+    image : PIL.Image
+        The uploaded frame.
+    box : (left, top, right, bottom), optional
+        Person bounding box in the uploaded image's pixel coordinates.
+    max_side : int, optional
+        Cap on the longest side of the working frame.
+    """
+    frame = image.convert("RGB")
+    scale = 1.0
+    if max_side and max(frame.size) > max_side:
+        scale = max_side / max(frame.size)
+        new_size = (max(1, round(frame.width * scale)), max(1, round(frame.height * scale)))
+        frame = frame.resize(new_size, Image.BILINEAR, reducing_gap=2.0)
+
+    if box is not None:
+        box = tuple(v * scale for v in box)
+    box = clamp_box(box, frame.size)
+    crop = frame if box == (0, 0) + frame.size else frame.crop(box)
+    return PreparedImage(frame=frame, box=box, crop=crop)
+
+
+def load_image(path: str, max_side: int | None = None) -> PreparedImage:
+    """
+    Decode an image file into a `PreparedImage` of the whole frame.
+
+    Module-level and free of torch imports so batch jobs can run it in
+    lightweight worker processes.
+    """
+    with Image.open(path) as image:
+        image.draft("RGB", (max_side, max_side) if max_side else image.size)
+        return prepare_image(image, max_side=max_side)
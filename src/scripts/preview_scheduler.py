@@ -0,0 +1,157 @@
+"""
+Latest-frame-wins scheduler for the live style preview.
+
+While a visitor is framing their shot, the camera page posts small preview
+frames a few times per second. Only style prediction runs on them (no
+segmentation), at a low resolution, on one worker thread with its own
+small torch thread budget and a frame-rate cap.
+
+There is a single slot for the next frame: a frame arriving while another
+is still waiting replaces it, and the replaced caller is told its frame was
+dropped. However slow the CPU, at most one frame waits and one runs, so the
+preview never builds a backlog. Frames are also dropped while shutter
+photos are waiting for the full pipeline, which always goes first.
+
+Usage
+-----
+>>> scheduler = PreviewScheduler(models)
+>>> predictions = scheduler.submit(scheduler.decode(jpeg_bytes)).result()  # None if dropped
+"""
+
+from __future__ import annotations
+
+import io
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Tuple
+
+from PIL import Image, UnidentifiedImageError
+
+from .. import config, metrics
+from .classify_outfit import _pin_torch_threads
+from .preprocess import Box, prepare_image
+
+FRAMES = metrics.counter("fashion_preview_frames_total", "Live preview frames by outcome", ("result",))
+
+
+class PreviewScheduler:
+    """Runs CLIP-only style prediction on the newest preview frame, dropping stale ones."""
+
+    def __init__(
+        self,
+        models,
+        max_side: int = config.PREVIEW_MAX_SIDE,
+        max_fps: float = config.PREVIEW_MAX_FPS,
+        num_threads: int = config.PREVIEW_THREADS,
+        busy: Callable[[], bool] | None = None,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        models : ModelLoader
+            Source of the loaded `OutfitClassifier` (only its style predictor is used).
+        max_side : int
+            Longest side preview frames are downscaled to.
+        max_fps : float
+            Most preview frames classified per second, across all visitors.
+        num_threads : int
+            Intra-op torch threads for the preview worker.
+        busy : callable, optional
+            Returns True while full-pipeline work is waiting; preview frames
+            are dropped until it returns False.
+        """
+        self.models = models
+        self.max_side = max_side
+        self.min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self.num_threads = num_threads
+        self.busy = busy
+        self._pending: Tuple[Image.Image, Box | None, Future] | None = None
+        self._condition = threading.Condition()
+        self._worker: threading.Thread | None = None
+        self._worker_pid: int | None = None
+        self._last_start = 0.0
+
+    def decode(self, image_bytes: bytes) -> Image.Image:
+        """
+        Decode a preview frame on the caller's thread.
+
+        Raises ValueError if the bytes are not a decodable image, so a bad
+        frame is the caller's error rather than a failure of the worker.
+        """
+        try:
+            with metrics.stage("decode"):
+                image = Image.open(io.BytesIO(image_bytes))
+                image.load()
+        except (UnidentifiedImageError, OSError):
+            raise ValueError("Invalid image") from None
+        return image
+
+    def submit(self, image: Image.Image, box: Box | None = None) -> Future:
+        """
+        Offer a decoded preview frame (see `decode`). The Future resolves to
+        the style predictions, or to None if a newer frame replaced this one
+        before it ran.
+        """
+        self._ensure_worker()
+        future: Future = Future()
+        with self._condition:
+            if self._pending is not None:
+                self._drop(self._pending[2])
+            self._pending = (image, box, future)
+            self._condition.notify()
+        return future
+
+    @staticmethod
+    def _drop(future: Future) -> None:
+        FRAMES.inc(result="dropped")
+        if future.set_running_or_notify_cancel():
+            future.set_result(None)
+
+    def _ensure_worker(self) -> None:
+        # Threads do not survive fork(), so (re)start the worker lazily in
+        # whichever process is actually serving requests.
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._condition:
+            if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+                return
+            if self._worker_pid != os.getpid():
+                self._pending = None
+            self._worker_pid = os.getpid()
+            self._worker = threading.Thread(target=self._run, name="preview", daemon=True)
+            self._worker.start()
+
+    def _next_frame(self) -> Tuple[Image.Image, Box | None, Future]:
+        with self._condition:
+            while self._pending is None:
+                self._condition.wait()
+        # Frame-rate cap: newer frames keep replacing the pending one meanwhile
+        wait = self._last_start + self.min_interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        with self._condition:
+            frame, self._pending = self._pending, None
+        return frame
+
+    def _run(self) -> None:
+        _pin_torch_threads(self.num_threads)
+        while True:
+            image, box, future = self._next_frame()
+            if self.busy is not None and self.busy():
+                self._drop(future)
+                continue
+            if not future.set_running_or_notify_cancel():
+                continue
+            self._last_start = time.monotonic()
+            try:
+                future.set_result(self._predict(image, box))
+                FRAMES.inc(result="classified")
+            except Exception as e:
+                future.set_exception(e)
+
+    def _predict(self, image: Image.Image, box: Box | None) -> List[Dict]:
+        with metrics.stage("preview"):
+            prepared = prepare_image(image, box=box, max_side=self.max_side)
+            return self.models.get().style_predictor.predict_batch([prepared.crop])[0]
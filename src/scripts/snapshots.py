@@ -0,0 +1,39 @@
+"""
+snapshots.py
+------------
+
+Load Hugging Face models from the local snapshot cache.
+
+`from_pretrained` normally asks the Hub whether a newer revision exists on
+every start, which is slow on booth Wi-Fi and hangs without a network. Here
+the local cache is always tried first with ``local_files_only=True``; the
+Hub is only contacted when the (optionally pinned) revision has never been
+downloaded, and never when ``FASHION_POLICE_HUB_OFFLINE=1``.
+
+Usage
+-----
+>>> model = from_pretrained(CLIPModel, config.CLIP_MODEL_NAME, config.CLIP_MODEL_REVISION)
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+from .. import config
+
+
+def model_id(model_name: str, revision: str | None = None) -> str:
+    """Model name plus pinned revision, used to key on-disk caches"""
+    return f"{model_name}@{revision}" if revision else model_name
+
+
+def from_pretrained(loader: Any, model_name: str, revision: str | None = None, **kwargs: Any) -> Any:
+    """`loader.from_pretrained` without network lookups once the snapshot is cached"""
+    revision = revision or None
+    try:
+        return loader.from_pretrained(model_name, revision=revision, local_files_only=True, **kwargs)
+    except OSError:
+        if config.HUB_OFFLINE:
+            raise
+    print(f"{model_id(model_name, revision)} is not cached locally, downloading it (runs once)...")
+    return loader.from_pretrained(model_name, revision=revision, **kwargs)
@@ -1,46 +1,149 @@
 ﻿from __future__ import annotations
-from typing import List, Dict
+from typing import Callable, List, Dict
+from pathlib import Path
+import hashlib
+import json
+import os
+import time
 from PIL import Image
 import torch
 from transformers import CLIPProcessor, CLIPModel
 from ..data.styles import STYLES
+from .. import config, metrics
+from .backends import ClipImageFeatures, load_backend
+from .snapshots import from_pretrained, model_id
 
 class StylePredictor:
     _model: CLIPModel | None = None
     _processor: CLIPProcessor | None = None
-    
-    def __init__(self) -> None:
+    # Image encoder per backend; the text encoder always runs eager fp32
+    _image_fns: Dict[str, Callable[[torch.Tensor], torch.Tensor]] = {}
+
+    # Style prompt embeddings, computed once and shared by every instance
+    _style_names: List[str] | None = None
+    _text_embeds: torch.Tensor | None = None
+    _text_key: str | None = None
+
+    def __init__(self, cache_dir: str | Path = config.EMBEDDING_CACHE_DIR, backend: str = config.CLIP_BACKEND) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.backend = backend
         self._ensure_loaded()
-    
+        self._image_features = self._ensure_image_backend(backend)
+        self._ensure_text_embeds()
+
     @classmethod
     def _ensure_loaded(cls) -> None:
         if cls._model is None or cls._processor is None:
-            cls._model = CLIPModel.from_pretrained("patrickjohncyh/fashion-clip")
-            cls._processor = CLIPProcessor.from_pretrained("patrickjohncyh/fashion-clip")
+            start = time.perf_counter()
+            cls._model = from_pretrained(CLIPModel, config.CLIP_MODEL_NAME, config.CLIP_MODEL_REVISION)
+            cls._processor = from_pretrained(CLIPProcessor, config.CLIP_MODEL_NAME, config.CLIP_MODEL_REVISION)
             cls._model = cls._model.to("cpu")
             cls._model.eval()
-    
-    def _embed_image(self, image: Image.Image) -> torch.Tensor:
-        inputs = self._processor(images=image, return_tensors="pt").to("cpu")
-        with torch.no_grad():
-            image_features = self._model.get_image_features(**inputs)
+            metrics.MODEL_LOAD_SECONDS.set(time.perf_counter() - start, model=cls._model_id())
+
+    @staticmethod
+    def _model_id() -> str:
+        return model_id(config.CLIP_MODEL_NAME, config.CLIP_MODEL_REVISION)
+
+    @classmethod
+    def _ensure_image_backend(cls, backend: str) -> Callable[[torch.Tensor], torch.Tensor]:
+        if backend not in cls._image_fns:
+            crop = cls._processor.image_processor.crop_size
+            example = torch.zeros(1, 3, crop["height"], crop["width"])
+            cls._image_fns[backend] = load_backend(
+                ClipImageFeatures(cls._model), backend, (example,), cls._model_id()
+            )
+        return cls._image_fns[backend]
+
+    @staticmethod
+    def _prompt_key(style_names: List[str], style_prompts: List[str]) -> str:
+        """Hash of the model id and prompt set, used to key the embedding cache"""
+        payload = json.dumps([StylePredictor._model_id(), style_names, style_prompts])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+    def _cache_path(self, key: str) -> Path:
+        model_slug = config.CLIP_MODEL_NAME.replace("/", "--")
+        return self.cache_dir / f"{model_slug}-{key}.pt"
+
+    def _ensure_text_embeds(self) -> None:
+        """
+        Load the style text embeddings from the on-disk cache, or encode the
+        prompts once and persist them. The cache key changes whenever the
+        prompts in STYLES change, so edits trigger a rebuild automatically.
+        """
+        style_names = list(STYLES.keys())
+        style_prompts = [STYLES[name]["description"] for name in style_names]
+        key = self._prompt_key(style_names, style_prompts)
+        if StylePredictor._text_key == key:
+            return
+
+        path = self._cache_path(key)
+        text_embeds = None
+        if path.exists():
+            try:
+                cached = torch.load(path, map_location="cpu")
+                if cached["style_names"] == style_names:
+                    text_embeds = cached["text_embeds"]
+            except Exception as e:
+                print(f"Ignoring unreadable style embedding cache {path}: {e}")
+
+        if text_embeds is None:
+            text_embeds = self._embed_text_list(style_prompts)
+            self._write_cache(path, style_names, text_embeds)
+
+        StylePredictor._style_names = style_names
+        StylePredictor._text_embeds = text_embeds
+        StylePredictor._text_key = key
+
+    def _write_cache(self, path: Path, style_names: List[str], text_embeds: torch.Tensor) -> None:
+        """Atomically persist the embeddings and drop stale entries for this model"""
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".tmp{os.getpid()}")
+            torch.save({"style_names": style_names, "text_embeds": text_embeds}, tmp_path)
+            os.replace(tmp_path, path)
+            model_slug = config.CLIP_MODEL_NAME.replace("/", "--")
+            for stale in path.parent.glob(f"{model_slug}-*.pt"):
+                if stale != path:
+                    stale.unlink(missing_ok=True)
+        except OSError as e:
+            print(f"Could not write style embedding cache {path}: {e}")
+
+    def _embed_image(self, image: Image.Image | List[Image.Image]) -> torch.Tensor:
+        with metrics.stage("clip_image_embed"):
+            inputs = self._processor(images=image, return_tensors="pt").to("cpu")
+            with torch.no_grad():
+                image_features = self._image_features(inputs["pixel_values"])
         return image_features / image_features.norm(dim=-1, keepdim=True)
-    
+
     def _embed_text_list(self, text_list: List[str]) -> torch.Tensor:
-        inputs = self._processor(text=text_list, return_tensors="pt", padding=True).to("cpu")
-        with torch.no_grad():
-            text_features = self._model.get_text_features(**inputs)
+        with metrics.stage("text_embed"):
+            inputs = self._processor(text=text_list, return_tensors="pt", padding=True).to("cpu")
+            with torch.no_grad():
+                text_features = self._model.get_text_features(**inputs)
         return text_features / text_features.norm(dim=-1, keepdim=True)
-    
+
     def predict(self, image: Image.Image) -> List[Dict]:
-        image_embed = self._embed_image(image)
-        style_names = list(STYLES.keys())
-        style_prompts = [STYLES[name]["description"] for name in style_names]
-        text_embeds = self._embed_text_list(style_prompts)
-        similarities = (image_embed @ text_embeds.T).squeeze(0)
-        scores = torch.softmax(similarities * 100, dim=0).cpu().numpy()
-        results = [
-            {"name": style_names[i], "score": float(scores[i]), "description": STYLES[style_names[i]]["description"]}
-            for i in range(len(style_names))
-        ]
-        return sorted(results, key=lambda x: x["score"], reverse=True)
+        return self.predict_batch([image])[0]
+
+    def predict_batch(self, images: List[Image.Image]) -> List[List[Dict]]:
+        """Score several images with a single batched image-encoder pass"""
+        return self.predictions_from_embeddings(self.embed_images(images))
+
+    def embed_images(self, images: List[Image.Image]) -> torch.Tensor:
+        """Normalized image embeddings, one row per image (what the EmbeddingStore keeps)"""
+        return self._embed_image(images)
+
+    def predictions_from_embeddings(self, image_embeds: torch.Tensor) -> List[List[Dict]]:
+        """Score stored or fresh image embeddings against the current style prompts"""
+        style_names = self._style_names
+        similarities = image_embeds.to(self._text_embeds.dtype) @ self._text_embeds.T
+        scores = torch.softmax(similarities * 100, dim=-1).cpu().numpy()
+        batch_results = []
+        for image_scores in scores:
+            results = [
+                {"name": style_names[i], "score": float(image_scores[i]), "description": STYLES[style_names[i]]["description"]}
+                for i in range(len(style_names))
+            ]
+            batch_results.append(sorted(results, key=lambda x: x["score"], reverse=True))
+        return batch_results
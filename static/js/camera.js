@@ -4,14 +4,20 @@ let video = document.getElementById("video");
 let canvas = document.getElementById("canvas");
 let preview = document.getElementById("preview");
 let stream = null;
-let capturedImage = null;
+let capturedImage = null; // JPEG Blob of the captured frame
 let boundingBoxActive = true;
 let detector = null;
 let detectionActive = false;
 let poseHoldStartTime = null;
 let poseDetectedForCapture = false;
 let scanningBool = false;
+let bodyBox = null; // Last person box in video pixels, sent with the photo
+let modelsReady = false; // Server has loaded and warmed up its models
+let previewActive = false; // Live style preview loop is running
+const previewCanvas = document.createElement("canvas");
 const POSE_HOLD_DURATION = 2000; // Hold pose for 2 seconds to capture
+const PREVIEW_INTERVAL = 500; // At most 2 live preview frames per second
+const PREVIEW_MAX_SIDE = 320; // Preview frames are small; the shutter photo is full size
 
 async function startCamera() {
   try {
@@ -91,6 +97,7 @@ async function startCamera() {
       await loadMoveNet();
       detectionActive = true;
       drawDetectionLoop();
+      previewLoop();
     };
 
     // Keep video playing (prevents auto-pause)
@@ -137,7 +144,33 @@ async function startCamera() {
   }
 }
 
+// Poll /ready until the server's models are loaded; the camera works meanwhile
+async function waitForModels() {
+  while (true) {
+    try {
+      const response = await fetch("/ready", { cache: "no-store" });
+      if (response.ok) {
+        modelsReady = true;
+        hideStatus();
+        return;
+      }
+      const status = await response.json();
+      if (status.state === "failed") {
+        showStatus("Style models failed to load: " + status.error, "error");
+        return;
+      }
+    } catch (error) {
+      console.log("Readiness check failed:", error);
+    }
+    showStatus("WARMING UP", "warming", true);
+    await new Promise((resolve) => setTimeout(resolve, 1000));
+  }
+}
+
 function capturePhoto() {
+  if (!modelsReady) {
+    return; // Nothing could analyze the photo yet
+  }
   boundingBoxActive = false;
   detectionActive = false;
   poseHoldStartTime = null; // Reset pose timer
@@ -149,22 +182,33 @@ function capturePhoto() {
   let ctx = canvas.getContext("2d");
   ctx.drawImage(video, 0, 0);
 
-  capturedImage = canvas.toDataURL("image/jpeg", 0.9);
+  // Encode once as a binary JPEG (no base64 round trip)
+  canvas.toBlob(
+    (blob) => {
+      capturedImage = blob;
 
-  preview.src = capturedImage;
-  preview.style.display = "block";
-  video.style.display = "none";
-  canvas.style.display = "none"; // Hide canvas overlay
+      preview.src = URL.createObjectURL(blob);
+      preview.style.display = "block";
+      video.style.display = "none";
+      canvas.style.display = "none"; // Hide canvas overlay
 
-  // Stop camera
-  if (stream) {
-    stream.getTracks().forEach((track) => track.stop());
-  }
+      // Stop camera
+      if (stream) {
+        stream.getTracks().forEach((track) => track.stop());
+      }
 
-  analyzePhoto()
+      analyzePhoto();
+    },
+    "image/jpeg",
+    0.9
+  );
 }
 
 function retakePhoto() {
+  bodyBox = null;
+  if (preview.src.startsWith("blob:")) {
+    URL.revokeObjectURL(preview.src);
+  }
   capturedImage = null;
   poseHoldStartTime = null; // Reset pose timer
   poseDetectedForCapture = false;
@@ -237,6 +281,7 @@ async function drawDetectionLoop() {
         minX = Math.max(0, minX - sidePadding);
         maxX = Math.min(canvas.width, maxX + sidePadding);
         maxY = Math.min(canvas.height, maxY + bottomPadding);
+        bodyBox = [minX, minY, maxX, maxY].map(Math.round);
 
         // Check if T-pose is detected
         const isPoseTrigger = checkCapturePose(pose);
@@ -278,7 +323,7 @@ async function drawDetectionLoop() {
           console.log("detected");
 
           // Trigger capture when pose held long enough
-          if (holdTime >= POSE_HOLD_DURATION && poseDetectedForCapture) {
+          if (holdTime >= POSE_HOLD_DURATION && poseDetectedForCapture && modelsReady) {
             poseDetectedForCapture = false;
             poseHoldStartTime = null;
             capturePhoto();
@@ -353,6 +398,68 @@ function checkCapturePose(pose) {
   return leftWristAtEyeLevel || rightWristAtEyeLevel;
 }
 
+// Live style guess while framing: one small frame in flight at a time, so a
+// slow server just means fewer updates, never a queue of stale frames
+async function previewLoop() {
+  if (previewActive) {
+    return;
+  }
+  previewActive = true;
+  while (detectionActive) {
+    const started = Date.now();
+    if (modelsReady && video.videoWidth > 0) {
+      try {
+        await sendPreviewFrame();
+      } catch (error) {
+        console.log("Preview failed:", error);
+      }
+    }
+    const elapsed = Date.now() - started;
+    await new Promise((resolve) =>
+      setTimeout(resolve, Math.max(0, PREVIEW_INTERVAL - elapsed))
+    );
+  }
+  previewActive = false;
+  document.getElementById("live-style").dataset.show = "false";
+}
+
+async function sendPreviewFrame() {
+  const scale = Math.min(
+    1,
+    PREVIEW_MAX_SIDE / Math.max(video.videoWidth, video.videoHeight)
+  );
+  previewCanvas.width = Math.round(video.videoWidth * scale);
+  previewCanvas.height = Math.round(video.videoHeight * scale);
+  previewCanvas
+    .getContext("2d")
+    .drawImage(video, 0, 0, previewCanvas.width, previewCanvas.height);
+  const blob = await new Promise((resolve) =>
+    previewCanvas.toBlob(resolve, "image/jpeg", 0.7)
+  );
+
+  const url = bodyBox
+    ? "/preview?box=" +
+      encodeURIComponent(bodyBox.map((v) => Math.round(v * scale)).join(","))
+    : "/preview";
+  const response = await fetch(url, {
+    method: "POST",
+    headers: { "Content-Type": "image/jpeg" },
+    body: blob,
+  });
+  if (!response.ok) {
+    return;
+  }
+  const result = await response.json();
+  if (result.dropped || !detectionActive) {
+    return;
+  }
+  const top = result.predictions[0];
+  const liveStyle = document.getElementById("live-style");
+  liveStyle.textContent =
+    top.name + " " + Math.round(top.confidence * 100) + "%";
+  liveStyle.dataset.show = "true";
+}
+
 async function analyzePhoto() {
   if (!capturedImage) {
     alert("Please capture a photo first");
@@ -365,16 +472,36 @@ async function analyzePhoto() {
   document.getElementById("analyze").disabled = true;
 
   try {
-    const response = await fetch("/process_image", {
+    // Let the server crop to the person (the box is in video pixels, same as the capture)
+    const url = bodyBox
+      ? "/process_image?box=" + encodeURIComponent(bodyBox.join(","))
+      : "/process_image";
+    const response = await fetch(url, {
       method: "POST",
       headers: {
-        "Content-Type": "application/json",
+        "Content-Type": "image/jpeg",
       },
-      body: JSON.stringify({ image: capturedImage }),
+      body: capturedImage,
     });
 
     if (response.ok) {
       window.location.href = "/results";
+    } else if (response.status === 503) {
+      const status = await response.json();
+      if (status.state) {
+        // Server restarted and is warming up again: wait, then retry
+        modelsReady = false;
+        await waitForModels();
+        if (!modelsReady) {
+          throw new Error("Style models are unavailable");
+        }
+      } else {
+        // Busy with other visitors' photos: retry when the server says to
+        const retryAfter = Number(response.headers.get("Retry-After")) || 5;
+        showStatus("BUSY", "warming", true);
+        await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000));
+      }
+      return analyzePhoto();
     } else {
       throw new Error("Failed to process image");
     }
@@ -427,6 +554,7 @@ setInterval(() => {
 // Auto-start camera on page load
 window.addEventListener("load", () => {
   setTimeout(startCamera, 500); // Small delay for reliability
+  waitForModels();
 });
 
 // Prevent page from going to sleep
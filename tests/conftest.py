@@ -0,0 +1,12 @@
+"""
+Shared test setup
+
+Importing the app creates its database, image store and journal under
+FASHION_POLICE_DATA_DIR, so point that at a scratch directory before any
+test imports src.config.
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault("FASHION_POLICE_DATA_DIR", tempfile.mkdtemp(prefix="fashion-police-tests-"))
@@ -0,0 +1,61 @@
+"""
+FashionDB migrations and statistics
+
+    python -m pytest tests/
+"""
+
+import json
+
+from src.database import FashionDB
+
+PREDICTIONS = [{"name": "Casual Chic", "description": "", "score": 0.9}]
+
+
+def legacy_json(path, records):
+    path.write_text(json.dumps({"predictions": records}))
+    return path
+
+
+def legacy_record(record_id, **fields):
+    return {"record_id": record_id, "timestamp": "2025-03-01T10:00:00", "top_prediction": "Casual Chic",
+            "top_confidence": 0.9, "all_predictions": PREDICTIONS, **fields}
+
+
+def test_migrate_json_already_renamed_by_another_worker(tmp_path, monkeypatch):
+    db = FashionDB(tmp_path / "predictions.db")
+    path = legacy_json(tmp_path / "predictions.json", [legacy_record("outfit_1")])
+
+    def renamed_elsewhere(self, target):
+        raise FileNotFoundError(self)
+
+    monkeypatch.setattr(type(path), "rename", renamed_elsewhere)
+    assert db.migrate_json(path) == 0
+    assert db.get_prediction("outfit_1") is not None
+
+
+def test_feedback_without_timestamp_rolls_up_on_its_capture_day(tmp_path):
+    db = FashionDB(tmp_path / "predictions.db")
+    db.migrate_json(legacy_json(tmp_path / "predictions.json", [
+        legacy_record("outfit_1", user_correction="Formal Business"),
+        legacy_record("outfit_2", timestamp="2025-03-02T09:00:00"),
+    ]))
+
+    rollups = dict((bucket, (predictions, feedback))
+                   for bucket, predictions, feedback in db.get_statistics(rollup="day")["rollups"])
+    assert rollups == {"2025-03-01": (1, 1), "2025-03-02": (1, 0)}
+
+
+def test_outdated_statistics_are_rebuilt(tmp_path):
+    path = tmp_path / "predictions.db"
+    db = FashionDB(path)
+    db.migrate_json(legacy_json(tmp_path / "predictions.json", [
+        legacy_record("outfit_1", user_correction="Formal Business"),
+    ]))
+    # A database from before the triggers were versioned, with stale rollups
+    conn = db._connect()
+    conn.execute("UPDATE stat_rollups SET feedback = 0")
+    conn.execute("PRAGMA user_version = 0")
+
+    stats = FashionDB(path).get_statistics(rollup="day")
+    assert stats["rollups"] == [("2025-03-01", 1, 1)]
+    assert stats["total_feedback"] == 1
@@ -0,0 +1,65 @@
+"""
+ImageStore deduplication racing eviction in another worker
+
+    python -m pytest tests/
+"""
+
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from src.database import FashionDB
+from src.image_store import ImageStore
+from src.persistence import PersistenceWriter
+
+PREDICTIONS = [{"name": "Casual Chic", "description": "", "score": 0.9}]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ImageStore(FashionDB(tmp_path / "predictions.db"), root=tmp_path / "images")
+
+
+def overlay():
+    return Image.new("RGB", (32, 32), (10, 200, 30))
+
+
+def test_shared_file_evicted_before_the_insert_is_rewritten(store, tmp_path, monkeypatch):
+    path = Path(store.put(overlay()))
+    save_prediction = store.db.save_prediction
+
+    def evicted_meanwhile(**record):
+        path.unlink()  # another worker evicts the file put() just reused
+        return save_prediction(**record)
+
+    monkeypatch.setattr(store.db, "save_prediction", evicted_meanwhile)
+    writer = PersistenceWriter(store.db, store, journal_dir=tmp_path / "journal", background=False)
+    writer.submit_prediction("outfit_1", overlay(), PREDICTIONS)
+
+    assert store.db.get_prediction("outfit_1")["image_path"] == str(path)
+    assert path.exists()
+
+
+def test_record_saved_during_eviction_loses_its_reference(store, monkeypatch):
+    path = store.put(overlay())
+    store.db.save_prediction("outfit_1", path, path, PREDICTIONS)
+    replace_image = store.db.replace_image
+    calls = []
+
+    def saved_meanwhile(*args, **kwargs):
+        updated = replace_image(*args, **kwargs)
+        if not calls:
+            # Another worker saves a record sharing the file after the update, before the unlink
+            store.db.save_prediction("outfit_2", path, path, PREDICTIONS)
+        calls.append(updated)
+        return updated
+
+    monkeypatch.setattr(store.db, "replace_image", saved_meanwhile)
+    store._evict("image_path", path)
+
+    assert not Path(path).exists()
+    for record_id in ("outfit_1", "outfit_2"):
+        record = store.db.get_prediction(record_id)
+        assert record["image_path"] is None
+        assert record["overlay_path"] != path
@@ -0,0 +1,104 @@
+"""
+Journal replay in PersistenceWriter.recover
+
+Journals are written through the writer itself, then handed to a fresh
+writer under the name of a process that no longer exists, as they would be
+after a crash.
+
+    python -m pytest tests/
+"""
+
+import json
+import queue
+import time
+
+import pytest
+from PIL import Image
+
+from src.database import FashionDB
+from src.image_store import ImageStore
+from src.persistence import PersistenceWriter
+
+DEAD_PID = 2 ** 31 - 1
+PREDICTIONS = [{"name": "Casual Chic", "description": "", "score": 0.9}]
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = FashionDB(tmp_path / "predictions.db")
+    db.save_prediction("outfit_1", None, None, PREDICTIONS)
+    return db
+
+
+def writer(db, tmp_path):
+    images = ImageStore(db, root=tmp_path / "images")
+    return PersistenceWriter(db, images, journal_dir=tmp_path / "journal", background=True)
+
+
+def crash(writer):
+    """Leave the writer's journal behind as if its process had died"""
+    writer._journal_file.close()
+    writer._journal_path().rename(writer._journal_path(DEAD_PID))
+
+
+def feedback(correction):
+    return {"op": "feedback", "record_id": "outfit_1", "user_correction": correction,
+            "timestamp": "2026-01-01T12:00:00"}
+
+
+def test_repeated_feedback_replays_only_the_unfinished_one(db, tmp_path):
+    first = writer(db, tmp_path)
+    first_feedback, second_feedback = feedback("Formal Business"), feedback("Urban Streetwear")
+    first._journal_append(first_feedback)
+    first._journal_append(second_feedback)
+    first._journal_done(first_feedback)
+    crash(first)
+
+    assert writer(db, tmp_path).recover() == 1
+    assert db.get_prediction("outfit_1")["user_correction"] == "Urban Streetwear"
+    assert not (tmp_path / "journal" / f"writer-{DEAD_PID}.jsonl").exists()
+
+
+def test_journal_without_seq_is_still_replayed(db, tmp_path):
+    journal = tmp_path / "journal"
+    journal.mkdir()
+    lines = [feedback("Formal Business"), {"op": "done", "record_id": "outfit_1", "of": "feedback"},
+             feedback("Urban Streetwear")]
+    (journal / f"writer-{DEAD_PID}.jsonl").write_text("".join(json.dumps(line) + "\n" for line in lines))
+
+    assert writer(db, tmp_path).recover() == 1
+    assert db.get_prediction("outfit_1")["user_correction"] == "Urban Streetwear"
+
+
+def test_failed_sync_fallback_stays_journaled(db, tmp_path, monkeypatch):
+    broken = writer(db, tmp_path)
+    monkeypatch.setattr("src.persistence.time.sleep", lambda seconds: None)
+
+    def queue_full(item, timeout=None):
+        raise queue.Full
+
+    def fail(operation, image):
+        raise OSError("disk full")
+
+    broken._ensure_worker()
+    monkeypatch.setattr(broken._queue, "put", queue_full)
+    monkeypatch.setattr(broken, "_apply", fail)
+    # Must not raise into the request that is waiting for its result
+    broken.submit_prediction("outfit_2", Image.new("RGB", (8, 8)), PREDICTIONS)
+    crash(broken)
+
+    assert writer(db, tmp_path).recover() == 1
+    assert db.get_prediction("outfit_2") is not None
+
+
+def test_feedback_waits_for_a_record_inserted_by_another_worker(db, tmp_path):
+    background = writer(db, tmp_path)
+    background.submit_feedback("outfit_3", "Formal Business")
+    background.submit_feedback("outfit_3", "Urban Streetwear")
+    # The other worker's writer gets to the insert a moment later
+    time.sleep(0.2)
+    db.save_prediction("outfit_3", None, None, PREDICTIONS)
+    background.flush()
+
+    assert db.get_prediction("outfit_3")["user_correction"] == "Urban Streetwear"
+    assert not background._journal_path().read_text()
@@ -0,0 +1,70 @@
+"""
+Label-map upsampling in SegmentationModel._labels
+
+The fast path ("labels") takes the argmax at logit resolution and upsamples
+the label map; the reference ("logits") upsamples the logits bilinearly
+first. They must produce the same shape, and agree everywhere except along
+region boundaries.
+
+Model-free: _labels only depends on the upsample mode, so no weights load.
+
+    python -m pytest tests/
+"""
+
+import numpy as np
+import pytest
+import torch
+
+from src.scripts.load_model import SegmentationModel
+
+NUM_LABELS = len(SegmentationModel.id2label)
+
+
+def labels(mode, logits, size):
+    model = SegmentationModel.__new__(SegmentationModel)
+    model.upsample = mode
+    return model._labels(logits, size)
+
+
+def segmentation_logits(seed, height=128, width=128, regions=6):
+    """SegFormer-like logits: a few smooth regions per label rather than per-pixel noise"""
+    generator = torch.Generator().manual_seed(seed)
+    coarse = torch.randn(1, NUM_LABELS, regions, regions, generator=generator) * 4
+    return torch.nn.functional.interpolate(coarse, size=(height, width), mode="bilinear", align_corners=False)
+
+
+@pytest.mark.parametrize("size", [(512, 384), (384, 512), (1280, 960), (100, 77)])
+def test_same_shape_and_dtype(size):
+    logits = segmentation_logits(0)
+    fast, reference = labels("labels", logits, size), labels("logits", logits, size)
+    assert fast.shape == reference.shape == (size[1], size[0])
+    assert fast.dtype == reference.dtype == np.uint8
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_agreement_on_structured_logits(seed):
+    logits = segmentation_logits(seed)
+    size = (1280, 960)
+    agreement = (labels("labels", logits, size) == labels("logits", logits, size)).mean()
+    # 18 labels in a 6x6 grid of blobs is far busier than a real outfit; only the
+    # few-pixel bands along region edges may differ (measured: 97.3-97.8%)
+    assert agreement >= 0.97
+
+
+def test_disagreement_only_near_boundaries():
+    logits = segmentation_logits(7)
+    size = (512, 512)
+    fast, reference = labels("labels", logits, size), labels("logits", logits, size)
+    # A pixel inside a region (same label across its 4x4 block of source cells) must match
+    low = logits.argmax(dim=1)[0].numpy()
+    uniform = np.ones_like(low, dtype=bool)
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            uniform &= low == np.roll(np.roll(low, dy, axis=0), dx, axis=1)
+    inside = np.kron(uniform[1:-1, 1:-1], np.ones((4, 4), dtype=bool))
+    assert (fast[4:-4, 4:-4][inside] == reference[4:-4, 4:-4][inside]).all()
+
+
+def test_identity_size_is_exact():
+    logits = torch.randn(1, NUM_LABELS, 64, 48)
+    assert (labels("labels", logits, (48, 64)) == labels("logits", logits, (48, 64))).all()
@@ -0,0 +1,85 @@
+"""
+Upload validation in /process_image and /preview
+
+Bodies that are not images must be turned away with a 400 before they reach
+the models, so the models are replaced by a stand-in that only reports
+ready and anything past validation would fail loudly.
+
+    python -m pytest tests/
+"""
+
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+import flask_app
+
+NOT_AN_IMAGE = b"this is not an image" * 10
+
+
+class ReadyModels:
+    ready = True
+
+    def start(self):
+        pass
+
+    def get(self, timeout=None):
+        raise AssertionError("an invalid upload reached the models")
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(flask_app, "models", ReadyModels())
+    return flask_app.app.test_client()
+
+
+def jpeg(size=(64, 48)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (200, 40, 40)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def uploads(data):
+    """The same bytes as a raw body, a multipart file and a base64 data URL"""
+    return [
+        {"data": data, "content_type": "image/jpeg"},
+        {"data": {"image": (io.BytesIO(data), "photo.jpg")}, "content_type": "multipart/form-data"},
+        {"json": {"image": "data:image/jpeg;base64," + base64.b64encode(data).decode()}},
+    ]
+
+
+@pytest.mark.parametrize("route", ["/process_image", "/preview"])
+@pytest.mark.parametrize("upload", range(3))
+def test_non_image_body_is_rejected(client, route, upload):
+    response = client.post(route, **uploads(NOT_AN_IMAGE)[upload])
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Invalid image"}
+
+
+@pytest.mark.parametrize("route", ["/process_image", "/preview"])
+def test_truncated_jpeg_is_rejected(client, route):
+    response = client.post(route, **uploads(jpeg()[:200])[0])
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Invalid image"}
+
+
+def test_malformed_base64_is_rejected(client):
+    response = client.post("/process_image", json={"image": "data:image/jpeg;base64,not base64!"})
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("Invalid base64 image")
+
+
+def test_valid_upload_passes_validation():
+    with flask_app.app.test_request_context("/process_image", data=jpeg(), content_type="image/jpeg"):
+        assert flask_app.read_uploaded_image() == jpeg()
+
+
+def test_preview_decode_rejects_bad_frames():
+    scheduler = flask_app.preview_scheduler
+    assert scheduler.decode(jpeg()).size == (64, 48)
+    with pytest.raises(ValueError, match="Invalid image"):
+        scheduler.decode(NOT_AN_IMAGE)
+    with pytest.raises(ValueError, match="Invalid image"):
+        scheduler.decode(jpeg()[:200])